@@ -1,11 +1,17 @@
 from pydantic import Field
 from pydantic_settings import BaseSettings
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     redis_url: str = Field("redis://localhost:6379", env='REDIS_URL')
     worker_port_range: tuple[int, int] = (8001, 80018)
     model_path: str = "/models/<model.gguf>"
     max_context: int = 2049
+
+    # Encoding of queue payloads, results and stream chunks in Redis (app/services/wire.py).
+    # Both formats are always readable; set 0 to keep writing plain JSON while API processes
+    # from before the versioned format are still running, then raise to 1
+    wire_format_version: int = 1
     
     # Default generation parameters
     default_temperature: float = 0.7
@@ -13,4 +19,61 @@ class Settings(BaseSettings):
     default_n_predict: int = 128
     default_system_prompt: str = ""
 
+    # Content-addressed image store
+    image_store_ttl: int = 600
+
+    # Image preprocessing at ingest
+    image_max_edge: int = 1024
+    image_format: str = "JPEG"
+    image_quality: int = 85
+    image_preprocess_workers: int = 2
+    image_download_concurrency: int = 8
+    image_download_timeout: float = 10.0
+    image_max_bytes: int = 20 * 1024 * 1024
+    # Allow image URLs on loopback, private and link-local addresses, e.g. an internal image host
+    image_download_allow_private: bool = False
+
+    # Response cache for temperature-0 requests (opt-in)
+    response_cache_enabled: bool = False
+    response_cache_ttl: int = 3600
+    response_cache_local_ttl: int = 60
+    response_cache_local_size: int = 1024
+    response_cache_max_bytes: int = 64 * 1024
+
+    # Share one generation between identical in-flight temperature-0 requests
+    request_coalescing_enabled: bool = True
+
+    # Request cost estimate used to pack batches against worker slot context
+    chars_per_token: float = 4.0
+    image_token_estimate: int = 256
+
+    # Admission control: reject with 429 when the estimated completion exceeds the request timeout
+    admission_control_enabled: bool = True
+    admission_headroom: float = 1.0
+    admission_default_tokens_per_second: float = 20.0
+    max_concurrent_waiters: int = 512
+
+    # Models accepted at ingest even while none of their workers is registered, e.g. during
+    # a rolling restart; models with registered workers are always accepted
+    served_models: List[str] = []
+
+    # Hedging of requests that opt in (ChatRequest.hedge): a short, non-streamed request still
+    # unanswered after the hedge_quantile latency of similar requests is also sent to a second
+    # worker, at most hedge_budget extra requests per request
+    hedge_max_n_predict: int = 64
+    hedge_quantile: float = 0.95
+    hedge_budget: float = 0.05
+
+    # Bulk jobs (POST /v1/predict/batch): size cap, default scheduling deadline and how long
+    # finished results stay collectable
+    batch_max_requests: int = 1000
+    batch_job_timeout: int = 3600
+    batch_job_result_ttl: int = 3600
+
+    # Name of this process in the dispatch consumer group; defaults to <hostname>-<pid>
+    queue_consumer_name: Optional[str] = None
+
+    # Weighted round-robin share per API key; unlisted keys get weight 1
+    tenant_weights: Dict[str, int] = {}
+
 settings = Settings()
\ No newline at end of file
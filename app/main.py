@@ -1,56 +1,65 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import logging
 
 from app.services.router import router
-from app.services.redis_pool import get_redis_pool
+from app.services.redis_pool import redis_queue_manager
 from app.services.batch_manager import queue_processor
+from app.services.result_notifier import result_notifier
+from app.services.image_preprocessor import image_preprocessor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    redis = get_redis_pool()
-    await redis.delete("idle_workers", "busy_workers")
-    
+    await result_notifier.start()
     await queue_processor.start()
     logger.info("Application started with Redis queue processor")
     
     yield
     
     await queue_processor.stop()
-    await redis.delete("idle_workers", "busy_workers")
+    await result_notifier.stop()
+    await image_preprocessor.close()
     logger.info("Application stopped")
 
 health_router = APIRouter()
 
 @health_router.get("/health")
 async def health():
-    redis = get_redis_pool()
-    idle = await redis.llen("idle_workers")
-    busy = await redis.llen("busy_workers")
-    total_workers = idle + busy
+    per_model = await redis_queue_manager.get_model_queue_stats()
+    workers = redis_queue_manager.total_stats(per_model)
     
-    if total_workers > 0:
+    if workers.get("total_workers", 0) > 0:
         return JSONResponse({
             "status": "ok",
             "workers": {
-                "idle": idle,
-                "busy": busy,
-                "total": total_workers
-            }
+                "idle": workers["idle_workers"],
+                "busy": workers["busy_workers"],
+                "total": workers["total_workers"],
+                "slots": workers["total_slots"],
+                "busy_slots": workers["busy_slots"]
+            },
+            "models": {model: stats["total_workers"] for model, stats in per_model.items()}
         })
     return JSONResponse({
         "status": "no_workers",
         "workers": {
             "idle": 0,
             "busy": 0,
-            "total": 0
+            "total": 0,
+            "slots": 0,
+            "busy_slots": 0
         }
     }, status_code=503)
 
+@health_router.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 app.include_router(health_router)
\ No newline at end of file
@@ -21,6 +21,17 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = Field(None, ge=0.0, le=2.0, description="Controls randomness in generation (0.0-2.0)")
     top_p: Optional[float] = Field(None, ge=0.0, le=1.0, description="Controls diversity of generation (0.0-1.0)")
     n_predict: Optional[int] = Field(None, ge=1, le=2048, description="Maximum number of tokens to generate")
+    priority: Literal["high", "normal", "low"] = Field("normal", description="Scheduling class; higher classes are always dequeued first")
+    timeout: Optional[float] = Field(None, gt=0, le=120, description="Seconds to wait for a result; requests not scheduled by then are dropped")
+    hedge: bool = Field(False, description="Also send the request to a second worker if the first is slower than usual (short, non-streamed requests only)")
+
+class StageTimings(BaseModel):
+    queue_ms: Optional[float] = Field(None, description="Time spent queued before a dispatcher claimed the request")
+    dispatch_ms: Optional[float] = Field(None, description="Time from claim until the worker call started")
+    worker_ms: Optional[float] = Field(None, description="Duration of the worker call")
+    prompt_ms: Optional[float] = Field(None, description="Prefill time reported by llama-server")
+    decode_ms: Optional[float] = Field(None, description="Decode time reported by llama-server")
+    total_ms: Optional[float] = Field(None, description="Time from arrival at the API until the response was ready")
 
 class ChatResponse(BaseModel):
     content: str = Field(..., description="Model's response content")
@@ -29,3 +40,21 @@ class ChatResponse(BaseModel):
     stop: bool = Field(..., description="Whether the model stopped generation")
     stop_type: Optional[str] = Field(None, description="Type of stop event")
     request_id: str = Field(..., description="Request ID for tracking")
+    cached: bool = Field(False, description="Whether the response was served from the response cache")
+    timings: Optional[StageTimings] = Field(None, description="Per-stage latency breakdown")
+
+class BatchPredictRequest(BaseModel):
+    requests: List[ChatRequest] = Field(..., min_length=1, description="Requests to run; their timeout fields are ignored")
+    timeout: Optional[float] = Field(None, gt=0, le=86400, description="Seconds the job's requests may wait to be scheduled; defaults to the server's batch_job_timeout")
+
+class BatchJob(BaseModel):
+    job_id: str = Field(..., description="Handle for collecting results from GET /v1/jobs/{job_id}")
+    request_ids: List[str] = Field(..., description="Request IDs in submission order")
+
+class JobResults(BaseModel):
+    job_id: str = Field(..., description="Job handle")
+    total: int = Field(..., description="Number of requests in the job")
+    completed: int = Field(..., description="Number of requests finished so far")
+    done: bool = Field(..., description="Whether every request has finished")
+    cursor: int = Field(..., description="Pass as cursor to receive only results finished after these")
+    results: List[ChatResponse] = Field(..., description="Results finished since the given cursor, in completion order")
@@ -1,3 +1,13 @@
+from .admission import *
 from .batch_manager import *
+from .batching import *
+from .hedging import *
+from .image_preprocessor import *
+from .image_store import *
+from .metrics import *
+from .prefix_affinity import *
 from .redis_pool import *
-from .router import *
\ No newline at end of file
+from .response_cache import *
+from .result_notifier import *
+from .router import *
+from .wire import *
\ No newline at end of file
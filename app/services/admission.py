@@ -0,0 +1,71 @@
+import math
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.batch_manager import queue_processor
+from app.services.redis_pool import redis_queue_manager, PRIORITIES
+
+class AdmissionController:
+    """
+    Rejects work up front instead of letting it wait out its timeout. A request is
+    refused when this process already has max_concurrent_waiters in flight, or when
+    the queue ahead of it plus its own generation is estimated to take longer than
+    its timeout, based on the observed per-slot decode rate.
+    """
+    def __init__(self):
+        self.waiters = 0
+        self.admitted = 0
+        self.rejected_overload = 0
+        self.rejected_concurrency = 0
+
+    async def try_admit(self, request_data: dict, priority: str, timeout: float) -> Optional[int]:
+        """Returns None and counts a waiter when admitted, else the Retry-After in seconds"""
+        if not settings.admission_control_enabled:
+            self.waiters += 1
+            return None
+
+        if self.waiters >= settings.max_concurrent_waiters:
+            self.rejected_concurrency += 1
+            return 1
+
+        estimate = await self.estimate_completion(request_data, priority)
+        if estimate is not None and estimate > timeout * settings.admission_headroom:
+            self.rejected_overload += 1
+            return max(1, math.ceil(estimate - timeout))
+
+        self.waiters += 1
+        self.admitted += 1
+        return None
+
+    def release(self):
+        self.waiters -= 1
+
+    async def estimate_completion(self, request_data: dict, priority: str) -> Optional[float]:
+        """
+        Seconds until this request would finish, or None when its model has no workers
+        (or no dispatch pool yet) to estimate from. Only the model's own queue counts.
+        """
+        model = request_data['model']
+        pool = queue_processor.pools.get(model)
+        stats = await redis_queue_manager.get_queue_stats(model)
+        if not stats["total_slots"] or pool is None:
+            return None
+
+        throughput = pool.throughput
+        # Only work at the same or a higher priority is served before this request
+        ahead = sum(stats[f"pending_{p}"] for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        ahead += stats["busy_slots"]
+
+        queue_wait = ahead * throughput.output_tokens / (throughput.tokens_per_second * stats["total_slots"])
+        own_tokens = min(request_data.get('n_predict', settings.default_n_predict), throughput.output_tokens)
+        return queue_wait + own_tokens / throughput.tokens_per_second
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "admission_waiters": self.waiters,
+            "admission_admitted": self.admitted,
+            "admission_rejected_overload": self.rejected_overload,
+            "admission_rejected_concurrency": self.rejected_concurrency
+        }
+
+admission_controller = AdmissionController()
@@ -1,138 +1,372 @@
 import asyncio
+import json
 import time
 import httpx
 import logging
+from typing import Dict, Optional, Set
 
-from app.services.redis_pool import redis_queue_manager, get_redis_pool
+from app.services.redis_pool import (
+    redis_queue_manager, get_redis_pool, DEFAULT_WORKER_SLOTS, MODEL_REGISTRY_TTL, VISIBILITY_TIMEOUT_MS
+)
+from app.config import settings
+from app.services.batching import AdaptiveBatchWindow, ThroughputEstimator
+from app.services.hedging import HedgeBudget, LatencyTracker, size_class
+from app.services.image_store import image_store
+from app.services.prefix_affinity import PrefixAffinityMap, prefix_fingerprint, continuation_fingerprint
+from app.services.metrics import (
+    BATCH_SIZE, DISPATCH_DELAY_SECONDS, HEDGED_REQUESTS, QUEUE_WAIT_SECONDS, REQUESTS_FAILED, REQUESTS_REQUEUED,
+    WORKER_LATENCY_SECONDS, observe_worker_timings
+)
 
 logger = logging.getLogger(__name__)
 
 BATCH_MAX_SIZE = 8
 BATCH_TIMEOUT_MS = 1000
-PROCESSING_INTERVAL = 0.1 
+SLOT_WAIT_INTERVAL = 0.05
+WORKER_HTTP_TIMEOUT = 120
+RECONNECT_DELAY = 1.0
+# Renew well within the visibility timeout so a busy consumer never looks stuck
+LEASE_RENEW_INTERVAL = VISIBILITY_TIMEOUT_MS / 1000 / 3
+
+def _empty_result(content: str = "", stop_type: str = "error") -> dict:
+    return {
+        "content": content,
+        "tokens_predicted": 0,
+        "tokens_evaluated": 0,
+        "stop": True,
+        "stop_type": stop_type
+    }
+
+class ModelPool:
+    """Dispatch state of one model, kept apart so a backlog on one model never delays another"""
+    def __init__(self, model: str):
+        self.model = model
+        self.task: Optional[asyncio.Task] = None
+        # Requests this process has claimed for the model and not yet finished
+        self.leases: Set[str] = set()
+        self.affinity = PrefixAffinityMap()
+        self.batch_window = AdaptiveBatchWindow(max_ms=BATCH_TIMEOUT_MS)
+        self.throughput = ThroughputEstimator(
+            default_tokens_per_second=settings.admission_default_tokens_per_second,
+            default_output_tokens=settings.default_n_predict
+        )
+        self.latency = LatencyTracker(quantile=settings.hedge_quantile)
+        self.hedge_budget = HedgeBudget(settings.hedge_budget)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            **self.affinity.get_stats(),
+            "hedge_eligible_requests": self.hedge_budget.requests,
+            "hedged_requests": self.hedge_budget.hedges,
+            "arrival_rate": self.batch_window.arrival_rate,
+            "batch_window_ms": self.batch_window.timeout_ms(),
+            "slot_tokens_per_second": self.throughput.tokens_per_second,
+            "avg_output_tokens": self.throughput.output_tokens
+        }
 
 class QueueProcessor:
     def __init__(self):
         self.redis = get_redis_pool()
-        self._processor_task = None
-        self._cleanup_task = None
+        self._registry_task = None
+        self._lease_task = None
+        self._cancel_task = None
         self._running = False
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # In-flight worker calls by request_id, so a cancellation can abort them
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.pools: Dict[str, ModelPool] = {}
 
     async def start(self):
-        if not self._processor_task:
+        if not self._registry_task:
             self._running = True
-            self._processor_task = asyncio.create_task(self._process_queue_loop())
-            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+            self._registry_task = asyncio.create_task(self._registry_loop())
+            self._lease_task = asyncio.create_task(self._lease_loop())
+            self._cancel_task = asyncio.create_task(self._cancel_loop())
             logger.info("Queue processor started with batch processing logic")
 
     async def stop(self):
-        if self._processor_task:
+        if self._registry_task:
             self._running = False
-            self._processor_task.cancel()
-            self._cleanup_task.cancel()
-            try:
-                await self._processor_task
-                await self._cleanup_task
-            except asyncio.CancelledError:
-                pass
+            tasks = [
+                self._registry_task, self._lease_task, self._cancel_task,
+                *(pool.task for pool in self.pools.values())
+            ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for model in self.pools:
+                try:
+                    await redis_queue_manager.remove_consumer(model)
+                except Exception as e:
+                    logger.warning(f"Could not leave the dispatch consumer group of {model}: {e}")
             logger.info("Queue processor stopped")
 
-    async def _process_queue_loop(self):
+        for worker_url in list(self._clients):
+            await self._close_client(worker_url)
+
+    def _ensure_pool(self, model: str) -> ModelPool:
+        pool = self.pools.get(model)
+        if pool is None:
+            pool = self.pools[model] = ModelPool(model)
+            pool.task = asyncio.create_task(self._process_queue_loop(pool))
+            logger.info(f"Started dispatch pool for model {model}")
+        return pool
+
+    async def _registry_loop(self):
+        """Start a dispatch pool for every model as soon as it is served or configured"""
+        while self._running:
+            try:
+                for model in await redis_queue_manager.get_models(refresh=True):
+                    self._ensure_pool(model)
+            except Exception as e:
+                logger.error(f"Error reading the model registry: {e}")
+            await asyncio.sleep(MODEL_REGISTRY_TTL)
+
+    async def _get_client(self, worker_url: str, model: str) -> httpx.AsyncClient:
+        """Long-lived keep-alive client per worker, pooled to the worker's llama-server slot count"""
+        client = self._clients.get(worker_url)
+        if client is None:
+            slots_key = redis_queue_manager.model_worker_keys(model)[1]
+            slots = int(await self.redis.hget(slots_key, worker_url) or DEFAULT_WORKER_SLOTS)
+            client = httpx.AsyncClient(
+                base_url=worker_url,
+                timeout=WORKER_HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=slots, max_keepalive_connections=slots)
+            )
+            # Another coroutine may have created one while we awaited Redis
+            client = self._clients.setdefault(worker_url, client)
+            logger.debug(f"Created HTTP client for {worker_url} with {slots} pooled connections")
+        return client
+
+    async def _close_client(self, worker_url: str):
+        client = self._clients.pop(worker_url, None)
+        if client:
+            await client.aclose()
+            logger.debug(f"Closed HTTP client for {worker_url}")
+
+    async def _evict_deregistered_clients(self):
+        registered = set()
+        for model in self.pools:
+            registered.update(await self.redis.hkeys(redis_queue_manager.model_worker_keys(model)[1]))
+        for worker_url in list(self._clients):
+            if worker_url not in registered:
+                await self._close_client(worker_url)
+
+    def get_dispatch_stats(self) -> Dict[str, Dict[str, float]]:
+        return {model: pool.get_stats() for model, pool in self.pools.items()}
+
+    async def _process_queue_loop(self, pool: ModelPool):
         """
-        Main processing loop with dual batch conditions:
-        1. Process when batch reaches BATCH_MAX_SIZE
-        2. Process after BATCH_TIMEOUT_MS even if batch is smaller
-        3. Only process if workers are available
+        Main processing loop, one per model:
+        1. Dequeue at most as many requests as the model's workers have free slots, no more
+           estimated tokens than those slots can hold and only requests that fit the largest
+           free slot (BATCH_MAX_SIZE caps the count); requests too large for any slot are
+           claimed too and failed as context_exceeded
+        2. A partial batch is held open for an adaptive window based on the arrival rate
+        3. Each request is dispatched to the least-loaded worker with a large enough free slot
         """
         while self._running:
             try:
-                idle_workers = await self.redis.llen('idle_workers')
+                workers = await redis_queue_manager.get_worker_stats(pool.model)
+                free_slots = workers["total_slots"] - workers["busy_slots"]
                 
-                if idle_workers > 0:
+                if free_slots > 0:
                     batch = await redis_queue_manager.dequeue_batch_with_timeout(
-                        batch_size=BATCH_MAX_SIZE,
-                        timeout_ms=BATCH_TIMEOUT_MS
+                        pool.model,
+                        batch_size=min(BATCH_MAX_SIZE, free_slots),
+                        timeout_ms=pool.batch_window.timeout_ms(),
+                        token_budget=workers["free_slot_tokens"],
+                        slot_tokens=workers["max_free_slot_context"],
+                        max_slot_tokens=workers["max_slot_context"]
                     )
                     
                     if batch:
-                        asyncio.create_task(self._process_batch(batch))
-                        logger.debug(f"Dispatched batch of {len(batch)} requests to available worker")
+                        claimed_at = time.time()
+                        BATCH_SIZE.observe(len(batch))
+                        for request in batch:
+                            request["claimed_at"] = claimed_at
+                            QUEUE_WAIT_SECONDS.labels(pool.model).observe(
+                                max(0, claimed_at - request["timestamp"] / 1000)
+                            )
+                            pool.leases.add(request["id"])
+                            pool.batch_window.observe(request["timestamp"])
+                        await self._dispatch_batch(pool, batch, workers["max_slot_context"])
                 else:
-                    logger.debug("No idle workers available, waiting...")
-                    await asyncio.sleep(0.5)
+                    logger.debug(f"No free {pool.model} worker slots available, waiting...")
+                    await asyncio.sleep(SLOT_WAIT_INTERVAL)
                     continue
                 
-                await asyncio.sleep(PROCESSING_INTERVAL)
-                
             except Exception as e:
-                logger.error(f"Error in queue processing loop: {e}")
+                logger.error(f"Error in queue processing loop for {pool.model}: {e}")
                 await asyncio.sleep(1)
 
-    async def _cleanup_loop(self):
-        """Cleanup failed requests every 30 seconds"""
+    async def _lease_loop(self):
+        """
+        Renew the claims on requests still being generated here; claims that stop being
+        renewed, e.g. because this process died, are taken over by another consumer's
+        next dequeue. Also aborts calls whose cancellation notice was missed, deregisters
+        workers whose heartbeat expired, corrects worker load drift against the heartbeats
+        and drops clients for workers that are gone.
+        """
         while self._running:
             try:
-                await redis_queue_manager.requeue_failed_requests()
-                await asyncio.sleep(30)
+                for request_id in await redis_queue_manager.get_cancelled(list(self._calls)):
+                    self._abort_call(request_id)
+                for model, pool in list(self.pools.items()):
+                    await redis_queue_manager.renew_leases(model, list(pool.leases))
+                    for worker_url in await redis_queue_manager.evict_dead_workers(model):
+                        logger.warning(f"Worker {worker_url} ({model}) stopped sending heartbeats, evicted it")
+                    for worker_url, correction in (await redis_queue_manager.reconcile_worker_load(model)).items():
+                        logger.warning(f"Worker {worker_url} ({model}) load drifted from its heartbeat, corrected by {correction:+d}")
+                await self._evict_deregistered_clients()
             except Exception as e:
-                logger.error(f"Error in cleanup loop: {e}")
-                await asyncio.sleep(30)
+                logger.error(f"Error in lease loop: {e}")
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+
+    async def _cancel_loop(self):
+        """Abort the worker call of every request cancelled while it runs here"""
+        while self._running:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(redis_queue_manager.cancel_channel)
+                while self._running:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._abort_call(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cancellation subscriber error, reconnecting: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await pubsub.reset()
+
+    def _abort_call(self, request_id: str):
+        """
+        Cancelling the call closes its connection to llama-server, which stops generating
+        and frees the slot instead of finishing a response nobody will read.
+        """
+        call = self._calls.get(request_id)
+        if call and not call.done():
+            logger.info(f"Request {request_id} was cancelled, aborting its worker call")
+            call.cancel()
 
-    async def _process_batch(self, batch: list):
+    async def _dispatch_batch(self, pool: ModelPool, batch: list, max_slot_context: int):
         """
-        Process a batch of requests concurrently using an available worker.
-        Flow: request_queue -> processing_queue -> worker (concurrent processing)
+        Give every request its own slot in the model's pool; llama-server's continuous batching
+        interleaves them, so one long generation never holds back the rest.
+        Flow: request_queue:<model> -> dispatch stream (this consumer's pending entries) -> worker slot
         """
+        requeued = False
+        for request in batch:
+            required_tokens = request["estimated_tokens"]
+            if required_tokens > max_slot_context:
+                logger.warning(f"Request {request['id']} needs ~{required_tokens} tokens, largest slot holds {max_slot_context}")
+                REQUESTS_FAILED.labels("context_exceeded").inc()
+                await self._finish_request(pool, request["id"], request["data"], _empty_result(
+                    f"Request needs about {required_tokens} tokens of context, workers provide {max_slot_context} per slot",
+                    stop_type="context_exceeded"
+                ))
+                continue
+
+            # Prefer the worker that most likely still holds this prompt prefix in its KV cache
+            fingerprint = prefix_fingerprint(request["data"])
+            preferred_worker = pool.affinity.lookup(fingerprint)
+            worker_url = await redis_queue_manager.acquire_worker_slot(pool.model, preferred_worker, required_tokens)
+            if not worker_url:
+                logger.warning(f"No free worker slot for request {request['id']}, re-queuing")
+                await redis_queue_manager.release_request(request["id"], pool.model)
+                REQUESTS_REQUEUED.labels("no_slot").inc()
+                pool.leases.discard(request["id"])
+                requeued = True
+                continue
+
+            pool.affinity.record_dispatch(preferred_worker, worker_url)
+            pool.affinity.record(fingerprint, worker_url)
+            asyncio.create_task(self._process_request(pool, worker_url, request))
+            logger.debug(f"Dispatched request {request['id']} to {worker_url}")
+
+        if requeued:
+            # The re-queued requests are back at the head of the queue; give slots time to free up
+            await asyncio.sleep(SLOT_WAIT_INTERVAL)
+
+    async def _process_request(self, pool: ModelPool, worker_url: str, request: dict):
+        request_id = request["id"]
+        request_data = request["data"]
+        model = pool.model
         start_time = time.time()
-        worker_url = await self.redis.brpoplpush('idle_workers', 'busy_workers', timeout=5)
+        timings = {
+            "queue_ms": max(0, request["claimed_at"] * 1000 - request["timestamp"]),
+            "dispatch_ms": (start_time - request["claimed_at"]) * 1000
+        }
+        DISPATCH_DELAY_SECONDS.labels(model, worker_url).observe(start_time - request["claimed_at"])
 
+        if request_data.get('stream'):
+            call = asyncio.create_task(self._stream_from_worker(worker_url, request_id, request_data))
+        elif request_data.get('hedge') and request_data.get('n_predict', 0) <= settings.hedge_max_n_predict:
+            call = asyncio.create_task(self._send_hedged(pool, worker_url, request))
+        else:
+            call = asyncio.create_task(self._send_to_worker(worker_url, request_data))
+        self._calls[request_id] = call
         try:
-            if not worker_url:
-                logger.warning(f"No worker available for batch of {len(batch)} requests, re-queuing")
-                for request in batch:
-                    await redis_queue_manager.enqueue_request(request["data"], request["id"])
-                return
-
-            logger.info(f"Worker {worker_url} processing batch of {len(batch)} requests concurrently")
-            for request in batch:
-                pass
-            
-            async def process_single_request(request):
-                request_id = request["id"]
-                request_data = request["data"]
-                
-                try:
-                    result = await self._send_to_worker(worker_url, request_data)
-                    await redis_queue_manager.store_result(request_id, result)
-                    logger.debug(f"Request {request_id} completed successfully")
-                except Exception as e:
-                    logger.error(f"Failed to process request {request_id}: {e}")
-                    error_result = {
-                        "content": f"Error processing request: {str(e)}",
-                        "tokens_predicted": 0,
-                        "tokens_evaluated": 0,
-                        "stop": True,
-                        "stop_type": "error"
-                    }
-                    await redis_queue_manager.store_result(request_id, error_result)
-            
-            await asyncio.gather(*[process_single_request(request) for request in batch])
+            # Shielded, so only _abort_call cancels the worker call
+            result = await asyncio.shield(call)
+            # A hedged request may have been answered by the second worker
+            served_by = result.pop("worker", worker_url)
+            worker_seconds = time.time() - start_time
+            WORKER_LATENCY_SECONDS.labels(model, served_by).observe(worker_seconds)
+            if not request_data.get('stream'):
+                pool.latency.observe(size_class(request_data), worker_seconds)
 
+            # Swap llama-server's timings block for the per-stage breakdown returned to clients
+            worker_timings = result.pop("timings", {})
+            observe_worker_timings(model, served_by, worker_timings, result["tokens_predicted"], result["tokens_evaluated"])
+            timings.update({
+                "worker_ms": worker_seconds * 1000,
+                "prompt_ms": worker_timings.get('prompt_ms'),
+                "decode_ms": worker_timings.get('predicted_ms')
+            })
+
+            pool.affinity.record(continuation_fingerprint(request_data, result["content"]), served_by)
+            pool.throughput.observe(result["tokens_predicted"], worker_seconds)
+            logger.debug(f"Request {request_id} completed successfully")
+        except asyncio.CancelledError:
+            if not call.cancelled():
+                raise
+            REQUESTS_FAILED.labels("cancelled").inc()
+            result = _empty_result(stop_type="cancelled")
+        except Exception as e:
+            logger.error(f"Failed to process request {request_id}: {e}")
+            REQUESTS_FAILED.labels("error").inc()
+            result = _empty_result(f"Error processing request: {str(e)}")
         finally:
-            if worker_url:
-                await self.redis.lrem("busy_workers", 1, worker_url)
-                await self.redis.lpush("idle_workers", worker_url)
-                logger.debug(f"Worker {worker_url} released back to idle pool")
-            
-            processing_time = (time.time() - start_time) * 1000
-            logger.info(f"Batch of {len(batch)} requests completed in {processing_time:.2f}ms (avg: {processing_time/len(batch):.2f}ms per request)")
+            self._calls.pop(request_id, None)
+            await redis_queue_manager.release_worker_slot(model, worker_url)
 
-    async def _send_to_worker(self, worker_url: str, request_data: dict) -> dict:
+        result["timings"] = timings
+        await self._finish_request(pool, request_id, request_data, result)
+
+        processing_time = (time.time() - start_time) * 1000
+        logger.info(f"Request {request_id} completed on {worker_url} in {processing_time:.2f}ms")
+
+    async def _finish_request(self, pool: ModelPool, request_id: str, request_data: dict, result: dict):
+        """Publish the result and drop every piece of per-request bookkeeping"""
+        await redis_queue_manager.store_result(request_id, result, request_data.get('job_id'))
+        if request_data.get('stream'):
+            await redis_queue_manager.append_stream_chunk(request_id, {**result, "final": True})
+        if request_data.get('coalesce_key'):
+            await redis_queue_manager.release_coalesce_key(request_data['coalesce_key'], request_id)
+        await redis_queue_manager.mark_request_completed(request_id, pool.model)
+        pool.leases.discard(request_id)
+
+    async def _build_payload(self, request_data: dict) -> dict:
+        """Render the chat messages into a llama-server /completion payload"""
         temperature = request_data.get('temperature', 0.7)
         top_p = request_data.get('top_p', 0.9)
         n_predict = request_data.get('n_predict', 128)
         system_prompt = request_data.get('system_prompt', '')
-        messages = request_data.get('messages', [])
+        # Image bytes are only pulled from the image store here, right before the worker call
+        messages = await image_store.resolve(request_data.get('messages', []))
     
         prompt_parts = []
         image_data = [] 
@@ -188,19 +422,107 @@ class QueueProcessor:
         if image_data:
             payload["image_data"] = image_data
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(f"{worker_url}/completion", json=payload)
+        return payload
+
+    async def _send_to_worker(self, worker_url: str, request_data: dict) -> dict:
+        payload = await self._build_payload(request_data)
+
+        client = await self._get_client(worker_url, request_data['model'])
+        response = await client.post("/completion", json=payload)
+        response.raise_for_status()
+        result = response.json()
+        
+        content = result.get('content', '').strip()
+        
+        return {
+            "content": content,
+            "tokens_predicted": result.get('tokens_predicted', 0),
+            "tokens_evaluated": result.get('tokens_evaluated', 0),
+            "stop": result.get('stop', False),
+            "stop_type": result.get('stop_type', 'unknown'),
+            "timings": result.get('timings', {})
+        }
+
+    async def _send_hedged(self, pool: ModelPool, worker_url: str, request: dict) -> dict:
+        """
+        Send to worker_url, and if it has not answered once the usual latency of similar
+        requests has passed, send the same request to another worker with a free slot,
+        within the pool's hedge budget. The first successful answer wins and the other
+        call is cancelled, which frees its slot. The result names the worker that answered.
+        """
+        request_data = request["data"]
+        pool.hedge_budget.earn()
+        primary = asyncio.create_task(self._send_to_worker(worker_url, request_data))
+        try:
+            threshold = pool.latency.threshold(size_class(request_data))
+            if threshold is not None:
+                await asyncio.wait({primary}, timeout=threshold)
+            if threshold is None or primary.done() or not pool.hedge_budget.try_spend():
+                return {**await primary, "worker": worker_url}
+
+            hedge_url = await redis_queue_manager.acquire_worker_slot(
+                pool.model, required_tokens=request["estimated_tokens"], excluded_worker=worker_url
+            )
+            if not hedge_url:
+                pool.hedge_budget.refund()
+                return {**await primary, "worker": worker_url}
+
+            logger.info(f"Request {request['id']} slower than {threshold:.2f}s on {worker_url}, hedging on {hedge_url}")
+            hedge = asyncio.create_task(self._send_to_worker(hedge_url, request_data))
+            calls = {primary: worker_url, hedge: hedge_url}
+            try:
+                pending = set(calls)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for call in done:
+                        if call.exception() is None:
+                            HEDGED_REQUESTS.labels(pool.model, "primary" if call is primary else "hedge").inc()
+                            return {**call.result(), "worker": calls[call]}
+                # Both calls failed; report the first worker's error
+                return {**primary.result(), "worker": worker_url}
+            finally:
+                hedge.cancel()
+                await redis_queue_manager.release_worker_slot(pool.model, hedge_url)
+        finally:
+            primary.cancel()
+
+    async def _stream_from_worker(self, worker_url: str, request_id: str, request_data: dict) -> dict:
+        """
+        Relay llama-server's streamed chunks into the per-request Redis stream.
+        Chunks are buffered in Redis, so a slow client never holds the worker slot;
+        if the client goes away the request is cancelled and _abort_call closes the
+        HTTP stream, which frees the slot.
+        """
+        payload = await self._build_payload(request_data)
+        payload["stream"] = True
+
+        content_parts = []
+        final_chunk = {}
+
+        client = await self._get_client(worker_url, request_data['model'])
+        async with client.stream("POST", "/completion", json=payload) as response:
             response.raise_for_status()
-            result = response.json()
-            
-            content = result.get('content', '').strip()
-            
-            return {
-                "content": content,
-                "tokens_predicted": result.get('tokens_predicted', 0),
-                "tokens_evaluated": result.get('tokens_evaluated', 0),
-                "stop": result.get('stop', False),
-                "stop_type": result.get('stop_type', 'unknown')
-            }
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                chunk = json.loads(line[len("data: "):])
+                if chunk.get('stop'):
+                    final_chunk = chunk
+                    break
+
+                content_parts.append(chunk.get('content', ''))
+                await redis_queue_manager.append_stream_chunk(request_id, {
+                    "content": chunk.get('content', ''),
+                    "stop": False
+                })
+
+        return {
+            "content": ''.join(content_parts).strip(),
+            "tokens_predicted": final_chunk.get('tokens_predicted', 0),
+            "tokens_evaluated": final_chunk.get('tokens_evaluated', 0),
+            "stop": final_chunk.get('stop', False),
+            "stop_type": final_chunk.get('stop_type', 'unknown'),
+            "timings": final_chunk.get('timings', {})
+        }
 
 queue_processor = QueueProcessor()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import math
+from typing import Optional
+
+from app.config import settings
+
+MESSAGE_OVERHEAD_TOKENS = 4
+EWMA_ALPHA = 0.2
+
+def estimate_request_tokens(request_data: dict) -> int:
+    """
+    Rough KV-cache footprint of a request on a llama-server slot: prompt text,
+    image embeddings and the requested output. Local and cheap, so it can run
+    for every dequeued request without a /tokenize round trip.
+    """
+    chars = len(request_data.get('system_prompt') or '')
+    images = 0
+    messages = request_data.get('messages', [])
+
+    for message in messages:
+        content = message.get('content', '')
+        if isinstance(content, list):
+            for item in content:
+                if item.get('type') == 'text':
+                    chars += len(item.get('text') or '')
+                elif item.get('type') == 'image_url':
+                    images += 1
+        else:
+            chars += len(content)
+
+    prompt_tokens = math.ceil(chars / settings.chars_per_token) + MESSAGE_OVERHEAD_TOKENS * (len(messages) + 1)
+    return prompt_tokens + images * settings.image_token_estimate + request_data.get('n_predict', 0)
+
+class AdaptiveBatchWindow:
+    """
+    How long to hold a partial batch open. With continuous batching on the workers
+    there is nothing to gain from waiting unless the next request is expected
+    almost immediately, so the window is the expected inter-arrival gap when that
+    gap is shorter than max_ms, and zero otherwise.
+    """
+    def __init__(self, max_ms: float):
+        self.max_ms = max_ms
+        self._mean_gap_ms: Optional[float] = None
+        self._last_arrival_ms: Optional[int] = None
+
+    def observe(self, enqueued_at_ms: int):
+        if self._last_arrival_ms is not None and enqueued_at_ms > self._last_arrival_ms:
+            gap = enqueued_at_ms - self._last_arrival_ms
+            if self._mean_gap_ms is None:
+                self._mean_gap_ms = gap
+            else:
+                self._mean_gap_ms += EWMA_ALPHA * (gap - self._mean_gap_ms)
+        if self._last_arrival_ms is None or enqueued_at_ms > self._last_arrival_ms:
+            self._last_arrival_ms = enqueued_at_ms
+
+    def timeout_ms(self) -> float:
+        if self._mean_gap_ms is None or self._mean_gap_ms > self.max_ms:
+            return 0
+        return self._mean_gap_ms
+
+    @property
+    def arrival_rate(self) -> float:
+        """Requests per second, from the smoothed inter-arrival gap"""
+        if not self._mean_gap_ms:
+            return 0.0
+        return 1000 / self._mean_gap_ms
+
+class ThroughputEstimator:
+    """EWMA of per-slot decode throughput and of tokens generated per request, from completed requests"""
+    def __init__(self, default_tokens_per_second: float, default_output_tokens: float):
+        self.tokens_per_second = default_tokens_per_second
+        self.output_tokens = default_output_tokens
+        self.samples = 0
+
+    def observe(self, tokens_predicted: int, seconds: float):
+        if tokens_predicted <= 0 or seconds <= 0:
+            return
+        self.samples += 1
+        self.tokens_per_second += EWMA_ALPHA * (tokens_predicted / seconds - self.tokens_per_second)
+        self.output_tokens += EWMA_ALPHA * (tokens_predicted - self.output_tokens)
@@ -0,0 +1,66 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Optional
+
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+# Hedges that can be saved up while traffic is quiet and spent in a burst
+MAX_HEDGE_CREDIT = 10.0
+
+def size_class(request_data: dict) -> str:
+    """
+    Requests expected to take about as long as each other: the requested output rounded
+    up to a power of two, and whether images have to be encoded first.
+    """
+    n_predict = max(1, request_data.get('n_predict') or 1)
+    has_images = any(
+        isinstance(message.get('content'), list)
+        and any(item.get('type') == 'image_url' for item in message['content'])
+        for message in request_data.get('messages', [])
+    )
+    return f"{2 ** math.ceil(math.log2(n_predict))}:{'image' if has_images else 'text'}"
+
+class LatencyTracker:
+    """Recent worker call latencies per size class, to tell a slow call from a normal one"""
+    def __init__(self, quantile: float, window: int = LATENCY_WINDOW):
+        self.quantile = quantile
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, size_class: str, seconds: float):
+        self._samples.setdefault(size_class, deque(maxlen=self.window)).append(seconds)
+
+    def threshold(self, size_class: str) -> Optional[float]:
+        """The quantile of the class's recent latencies, or None until there are enough of them"""
+        samples = self._samples.get(size_class)
+        if not samples or len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+class HedgeBudget:
+    """
+    Caps hedges at a fraction of requests: every eligible request earns `fraction` of a
+    hedge, every hedge spends a whole one.
+    """
+    def __init__(self, fraction: float):
+        self.fraction = fraction
+        self.credit = 0.0
+        self.requests = 0
+        self.hedges = 0
+
+    def earn(self):
+        self.requests += 1
+        self.credit = min(MAX_HEDGE_CREDIT, self.credit + self.fraction)
+
+    def try_spend(self) -> bool:
+        if self.credit < 1:
+            return False
+        self.credit -= 1
+        self.hedges += 1
+        return True
+
+    def refund(self):
+        """Give back a hedge that could not be sent, e.g. for lack of a free slot"""
+        self.credit = min(MAX_HEDGE_CREDIT, self.credit + 1)
+        self.hedges -= 1
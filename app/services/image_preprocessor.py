@@ -0,0 +1,165 @@
+import asyncio
+import base64
+import io
+import ipaddress
+import logging
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union
+
+import httpx
+from PIL import Image, UnidentifiedImageError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_REDIRECTS = 5
+
+def preprocess_image(image: Union[bytes, str], max_edge: int, image_format: str, quality: int) -> str:
+    """
+    Decode, downscale so the longest edge is at most max_edge, and re-encode. image is raw
+    bytes or a base64 data URI, whose base64 is decoded here as well.
+    Runs in a worker process, so it must stay a picklable module-level function.
+    Returns a data URI.
+    """
+    if isinstance(image, str):
+        try:
+            data = base64.b64decode(image.split(',', 1)[1])
+        except (IndexError, ValueError):
+            raise ValueError("Malformed image data URI")
+    else:
+        data = image
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Invalid image: {e}")
+
+    # Already small and in the target format: pass the original bytes through untouched
+    if max(image.size) <= max_edge and image.format == image_format:
+        encoded = data
+    else:
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, quality=quality, optimize=True)
+        encoded = buffer.getvalue()
+
+    return f"data:image/{image_format.lower()};base64,{base64.b64encode(encoded).decode()}"
+
+class ImagePreprocessor:
+    """
+    Turns client images into compact data URIs without blocking the event loop:
+    base64 decoding and resizing run in a process pool, http(s) URLs are fetched from
+    public addresses only, with a bounded number of concurrent downloads.
+    """
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._download_semaphore = asyncio.Semaphore(settings.image_download_concurrency)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.image_preprocess_workers)
+        return self._executor
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Redirects are followed by _download, which checks every hop's address first
+            self._client = httpx.AsyncClient(timeout=settings.image_download_timeout)
+        return self._client
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    async def _public_address(url: httpx.URL) -> Optional[str]:
+        """
+        Resolve the host and refuse it if it resolves to loopback, private, link-local or
+        other non-public addresses, so client URLs cannot reach the workers, Redis or cloud
+        metadata services. Returns the vetted address to connect to, since resolving again
+        at connect time could give a different answer (DNS rebinding); None when
+        settings.image_download_allow_private is set.
+        """
+        if settings.image_download_allow_private:
+            return None
+        port = url.port or (443 if url.scheme == "https" else 80)
+        try:
+            addresses = await asyncio.get_running_loop().getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise ValueError(f"Failed to resolve image host {url.host}: {e}")
+        for *_, sockaddr in addresses:
+            try:
+                address = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+            except ValueError:
+                raise ValueError(f"Image host {url.host} resolves to an unsupported address")
+            address = getattr(address, "ipv4_mapped", None) or address
+            if not address.is_global or address.is_multicast:
+                raise ValueError(f"Image host {url.host} is not a public address")
+        return addresses[0][4][0].split('%', 1)[0]
+
+    async def _download(self, url: str) -> bytes:
+        async with self._download_semaphore:
+            try:
+                target = httpx.URL(url)
+                for _ in range(MAX_IMAGE_REDIRECTS + 1):
+                    if target.scheme not in ("http", "https"):
+                        raise ValueError(f"Unsupported image URL: {str(target)[:64]}")
+                    address = await self._public_address(target)
+                    request_url, headers, extensions = target, None, None
+                    if address:
+                        # Connect to the vetted address; Host, SNI and certificate checks keep the name
+                        request_url = target.copy_with(host=address)
+                        headers = {"Host": target.netloc.decode("ascii")}
+                        extensions = {"sni_hostname": target.host}
+                    async with self._get_client().stream(
+                        "GET", request_url, headers=headers, extensions=extensions
+                    ) as response:
+                        if response.has_redirect_location:
+                            # Resolved against the original name, not the pinned address
+                            target = target.join(response.headers["Location"])
+                            continue
+                        response.raise_for_status()
+                        chunks = []
+                        size = 0
+                        async for chunk in response.aiter_bytes():
+                            size += len(chunk)
+                            if size > settings.image_max_bytes:
+                                raise ValueError(f"Image at {url} exceeds {settings.image_max_bytes} bytes")
+                            chunks.append(chunk)
+                        return b"".join(chunks)
+                raise ValueError(f"Image at {url} redirects more than {MAX_IMAGE_REDIRECTS} times")
+            except (httpx.HTTPError, httpx.InvalidURL) as e:
+                raise ValueError(f"Failed to fetch image {url}: {e}")
+
+    async def process(self, url: str) -> str:
+        """Accepts a data URI or an http(s) URL and returns a preprocessed data URI"""
+        if url.startswith('data:image/'):
+            # Decoded in the process pool; base64 carries 3 bytes per 4 characters
+            if (len(url) - url.find(',') - 1) * 3 // 4 > settings.image_max_bytes:
+                raise ValueError(f"Image data URI exceeds {settings.image_max_bytes} bytes")
+            data = url
+        elif url.startswith(('http://', 'https://')):
+            data = await self._download(url)
+        else:
+            raise ValueError(f"Unsupported image URL: {url[:64]}")
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            preprocess_image,
+            data,
+            settings.image_max_edge,
+            settings.image_format,
+            settings.image_quality
+        )
+
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,95 @@
+import asyncio
+import copy
+import hashlib
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.services.image_preprocessor import image_preprocessor
+from app.services.redis_pool import get_redis_pool
+
+IMAGE_REF_SCHEME = "vlm-image:"
+
+def _image_urls(messages: List[dict]):
+    """Yield every image_url dict in the messages, so callers can rewrite url in place"""
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, list):
+            for item in content:
+                if item.get('type') == 'image_url' and item.get('image_url'):
+                    yield item['image_url']
+
+class ImageStore:
+    """
+    Content-addressed store for request images. Images are pulled out of the request
+    at ingest, preprocessed, and stored once under the SHA-256 of the input, so the
+    queue only carries short references and identical images share one Redis key.
+    """
+    def __init__(self):
+        self.redis = get_redis_pool()
+        self.key_prefix = "vlm_image:"
+
+    @staticmethod
+    def image_hash(reference: str) -> Optional[str]:
+        if reference.startswith(IMAGE_REF_SCHEME):
+            return reference[len(IMAGE_REF_SCHEME):]
+        return None
+
+    async def externalize(self, messages: List[dict], ttl: Optional[int] = None) -> List[dict]:
+        """
+        Replace every data URI or http(s) image with a vlm-image:<sha256> reference.
+        The hash is of the client's input, so an image that is already stored skips
+        download and preprocessing entirely and only has its TTL refreshed.
+        Images are kept for ttl seconds (default settings.image_store_ttl), which must
+        outlast the time the request may wait in the queue; a longer TTL set for another
+        request is never shortened.
+        """
+        ttl = ttl or settings.image_store_ttl
+        images: Dict[str, str] = {}
+        for image_url in _image_urls(messages):
+            url = image_url.get('url', '')
+            if url.startswith(('data:image/', 'http://', 'https://')):
+                digest = hashlib.sha256(url.encode()).hexdigest()
+                images[digest] = url
+                image_url['url'] = f"{IMAGE_REF_SCHEME}{digest}"
+
+        if not images:
+            return messages
+
+        digests = list(images)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for digest in digests:
+                pipe.exists(f"{self.key_prefix}{digest}")
+                pipe.expire(f"{self.key_prefix}{digest}", ttl, gt=True)
+            cached = (await pipe.execute())[0::2]
+
+        missing = [digest for digest, hit in zip(digests, cached) if not hit]
+        if missing:
+            processed = await asyncio.gather(*[image_preprocessor.process(images[digest]) for digest in missing])
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for digest, url in zip(missing, processed):
+                    pipe.set(f"{self.key_prefix}{digest}", url, ex=ttl)
+                await pipe.execute()
+        return messages
+
+    async def resolve(self, messages: List[dict]) -> List[dict]:
+        """Return a copy of the messages with references swapped back for the stored data URIs"""
+        digests = list({
+            digest for image_url in _image_urls(messages)
+            if (digest := self.image_hash(image_url.get('url', '')))
+        })
+        if not digests:
+            return messages
+
+        stored = await self.redis.mget([f"{self.key_prefix}{digest}" for digest in digests])
+        images = dict(zip(digests, stored))
+
+        resolved = copy.deepcopy(messages)
+        for image_url in _image_urls(resolved):
+            digest = self.image_hash(image_url.get('url', ''))
+            if digest:
+                if images[digest] is None:
+                    raise ValueError(f"Image {digest} expired from the image store")
+                image_url['url'] = images[digest]
+        return resolved
+
+image_store = ImageStore()
@@ -0,0 +1,57 @@
+from typing import Any, Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Generation latencies span a few milliseconds (cache hits) to the 120 s request timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "vlm_queue_wait_seconds", "Time from enqueue until a dispatcher claimed the request",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+DISPATCH_DELAY_SECONDS = Histogram(
+    "vlm_dispatch_delay_seconds", "Time from claim until the worker call started",
+    ["model", "worker"], buckets=LATENCY_BUCKETS
+)
+WORKER_LATENCY_SECONDS = Histogram(
+    "vlm_worker_latency_seconds", "Duration of the llama-server /completion call",
+    ["model", "worker"], buckets=LATENCY_BUCKETS
+)
+END_TO_END_SECONDS = Histogram(
+    "vlm_end_to_end_seconds", "Time from request arrival at the API until the response was ready",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "vlm_batch_size", "Requests claimed per dequeue",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+
+WORKER_PROMPT_TOKENS_PER_SECOND = Gauge(
+    "vlm_worker_prompt_tokens_per_second", "Prefill rate of the last completion, from llama-server timings",
+    ["model", "worker"]
+)
+WORKER_DECODE_TOKENS_PER_SECOND = Gauge(
+    "vlm_worker_decode_tokens_per_second", "Decode rate of the last completion, from llama-server timings",
+    ["model", "worker"]
+)
+TOKENS_PREDICTED = Counter("vlm_tokens_predicted", "Generated tokens", ["model", "worker"])
+TOKENS_EVALUATED = Counter("vlm_tokens_evaluated", "Prompt tokens evaluated", ["model", "worker"])
+
+REQUESTS_REQUEUED = Counter(
+    "vlm_requests_requeued", "Claimed requests put back in the queue or taken over from another consumer",
+    ["reason"]
+)
+HEDGED_REQUESTS = Counter(
+    "vlm_hedged_requests", "Requests also sent to a second worker, by which call answered first",
+    ["model", "winner"]
+)
+REQUESTS_FAILED = Counter("vlm_requests_failed", "Requests finished without a generation", ["reason"])
+
+def observe_worker_timings(model: str, worker: str, timings: Dict[str, Any], tokens_predicted: int, tokens_evaluated: int):
+    """Record llama-server's own timings block for one completion"""
+    if timings.get('prompt_per_second'):
+        WORKER_PROMPT_TOKENS_PER_SECOND.labels(model, worker).set(timings['prompt_per_second'])
+    if timings.get('predicted_per_second'):
+        WORKER_DECODE_TOKENS_PER_SECOND.labels(model, worker).set(timings['predicted_per_second'])
+    TOKENS_PREDICTED.labels(model, worker).inc(tokens_predicted)
+    TOKENS_EVALUATED.labels(model, worker).inc(tokens_evaluated)
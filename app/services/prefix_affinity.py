@@ -0,0 +1,66 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+AFFINITY_MAP_SIZE = 10000
+
+def _fingerprint(system_prompt: str, messages: List[dict]) -> str:
+    canonical = json.dumps([system_prompt, messages], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+def prefix_fingerprint(request_data: dict) -> Optional[str]:
+    """
+    Fingerprint of the prompt prefix llama-server can reuse from its KV cache:
+    the system prompt plus every turn before the last one. None if there is no prefix.
+    """
+    system_prompt = request_data.get('system_prompt') or ''
+    messages = request_data.get('messages', [])[:-1]
+    if not system_prompt and not messages:
+        return None
+    return _fingerprint(system_prompt, messages)
+
+def continuation_fingerprint(request_data: dict, reply: str) -> str:
+    """Prefix fingerprint the next turn of this conversation will have once the reply is appended"""
+    messages = request_data.get('messages', []) + [{"role": "assistant", "content": reply}]
+    return _fingerprint(request_data.get('system_prompt') or '', messages)
+
+class PrefixAffinityMap:
+    """Bounded LRU map from prefix fingerprint to the worker that last served it"""
+    def __init__(self, max_size: int = AFFINITY_MAP_SIZE):
+        self.max_size = max_size
+        self._workers: "OrderedDict[str, str]" = OrderedDict()
+        self.lookups = 0
+        self.known = 0
+        self.hits = 0
+
+    def lookup(self, fingerprint: Optional[str]) -> Optional[str]:
+        if fingerprint is None:
+            return None
+        self.lookups += 1
+        worker_url = self._workers.get(fingerprint)
+        if worker_url:
+            self.known += 1
+            self._workers.move_to_end(fingerprint)
+        return worker_url
+
+    def record(self, fingerprint: Optional[str], worker_url: str):
+        if fingerprint is None:
+            return
+        self._workers[fingerprint] = worker_url
+        self._workers.move_to_end(fingerprint)
+        while len(self._workers) > self.max_size:
+            self._workers.popitem(last=False)
+
+    def record_dispatch(self, preferred_worker: Optional[str], worker_url: str):
+        if preferred_worker and preferred_worker == worker_url:
+            self.hits += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            "affinity_lookups": self.lookups,
+            "affinity_known_prefixes": self.known,
+            "affinity_hits": self.hits,
+            "affinity_hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+            "affinity_map_size": len(self._workers)
+        }
@@ -1,9 +1,485 @@
 import redis.asyncio as redis
 from functools import lru_cache
+import hashlib
+import os
+import socket
 import time
 import json
 from app.config import settings
-from typing import Dict, Any, Optional, List
+from app.services.batching import estimate_request_tokens
+from app.services.metrics import REQUESTS_FAILED, REQUESTS_REQUEUED
+from app.services.wire import DECODE_PAYLOAD_LUA, decode_payload, encode_payload
+from typing import Dict, Any, Optional, List, Set
+
+DEFAULT_DEADLINE_MS = 120000
+# A claimed request whose consumer stops renewing it for this long is taken over by another one
+VISIBILITY_TIMEOUT_MS = 30000
+MAX_RETRIES = 1
+# Seconds a cancellation is remembered, on top of the time a queued request may still wait
+CANCEL_MARKER_TTL = 300
+
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+DEFAULT_TENANT = "anonymous"
+
+def tenant_id(api_key: Optional[str]) -> str:
+    """Tenants are identified by a hash of their API key so keys never land in Redis"""
+    if not api_key:
+        return DEFAULT_TENANT
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+# Every model served has its own queue, dispatch stream and worker pool, so a backlog on one
+# model never holds up another. Queue layout, built from a per-model prefix
+# (vlm_request_queue:<model>; single-node Redis, so keys derived inside scripts are fine):
+#   <prefix>:<priority>:<tenant>   sorted set of payloads scored by deadline (EDF within a tenant)
+#   <prefix>:rotation:<priority>   list of tenants with queued work, served weighted round-robin
+#   <prefix>:tenants:<priority>    set mirroring the rotation list for O(1) membership checks
+#   <prefix>:turns:<priority>      hash of picks each tenant has had in its current turn
+#   <prefix>:pending               hash of queued request counts per priority
+#   <prefix>:signal                short list pushed on enqueue so idle dispatchers can block on it
+# Claimed requests move to a dispatch stream read through a consumer group, one consumer per
+# API process, so the group's pending entries list tracks who is working on what:
+#   vlm_dispatch:<model>           stream of claimed payloads, acked and deleted on completion
+#   vlm_inflight                   hash of request_id -> dispatch stream entry id (all models)
+#   vlm_queued                     hash of request_id -> deadline of requests waiting in a queue (all models)
+# Workers register under the model they serve:
+#   worker_load:<model>            sorted set of worker URL -> slots in use
+#   worker_slots:<model>           hash of worker URL -> parallel slots
+#   worker_context:<model>         hash of worker URL -> context size
+#   worker_load_drift:<model>      hash of worker URL -> last heartbeat-vs-load difference seen
+#   worker_models                  set of models with at least one registered worker
+# Payloads are stored in the app.services.wire format; the scripts also read legacy JSON ones.
+PUSH_REQUEST_LUA = DECODE_PAYLOAD_LUA + """
+local function push_request(prefix, queued, item)
+    local request = decode_payload(item)
+    local priority = request['priority']
+    local tenant = request['tenant']
+    redis.call('ZADD', prefix .. ':' .. priority .. ':' .. tenant, request['deadline'], item)
+    redis.call('HSET', queued, request['id'], request['deadline'])
+    if redis.call('SADD', prefix .. ':tenants:' .. priority, tenant) == 1 then
+        redis.call('RPUSH', prefix .. ':rotation:' .. priority, tenant)
+    end
+    redis.call('HINCRBY', prefix .. ':pending', priority, 1)
+    redis.call('LPUSH', prefix .. ':signal', 1)
+    redis.call('LTRIM', prefix .. ':signal', 0, 63)
+end
+"""
+
+# KEYS: queued  ARGV: queue_prefix, payload
+ENQUEUE_REQUEST_SCRIPT = PUSH_REQUEST_LUA + """
+push_request(ARGV[1], KEYS[1], ARGV[2])
+return 1
+"""
+
+# Claim up to max_count requests in one call for this consumer. Entries another consumer
+# has not renewed within the visibility timeout are taken over first; those already
+# delivered max_deliveries times are acked and returned as exhausted instead. New picks
+# follow strict priority order, weighted round-robin across tenants and earliest deadline
+# first within a tenant, and are added to the dispatch stream and read into this
+# consumer's pending list in the same call. Claiming stops early once the requests'
+# estimated_tokens reach token_budget (< 0: no budget). Requests whose deadline already
+# passed are returned separately so the caller can fail them fast, and so are requests
+# cancelled while queued (a <cancel_prefix><request_id> key exists), whether new picks or
+# takeovers. Every item counts towards max_count, which bounds the work per call.
+# A tenant whose next request needs more than slot_tokens (< 0: no limit), the largest free
+# slot, is passed over until a large enough slot frees up; the tenants behind it are served
+# meanwhile and the number passed over is returned as blocked_count. Requests needing more
+# than max_slot_tokens, the largest slot of any worker, never fit and are always taken so
+# the caller can fail them instead of letting them block their tenant until the deadline.
+# Returns {claimed_items, expired_items, exhausted_items, taken_over_count, cancelled_items, blocked_count}.
+# KEYS: inflight, dispatch_stream, queued
+# ARGV: queue_prefix, group, consumer, now_ms, visibility_timeout_ms, max_deliveries,
+#       tenant_weights_json, max_count, token_budget, cancel_prefix, slot_tokens, max_slot_tokens,
+#       priorities...
+CLAIM_BATCH_SCRIPT = DECODE_PAYLOAD_LUA + """
+local prefix = ARGV[1]
+local stream, group, consumer = KEYS[2], ARGV[2], ARGV[3]
+local now = tonumber(ARGV[4])
+local weights = cjson.decode(ARGV[7])
+local max_count = tonumber(ARGV[8])
+local token_budget = tonumber(ARGV[9])
+local cancel_prefix = ARGV[10]
+local slot_tokens = tonumber(ARGV[11])
+local max_slot_tokens = tonumber(ARGV[12])
+
+if redis.call('EXISTS', stream) == 0 then
+    redis.call('XGROUP', 'CREATE', stream, group, '0', 'MKSTREAM')
+end
+
+local function is_cancelled(item)
+    return redis.call('EXISTS', cancel_prefix .. decode_payload(item)['id']) == 1
+end
+-- Expired, cancelled and oversized requests are always taken, they only need failing
+local function can_take(item, deadline)
+    if slot_tokens < 0 or deadline < now or is_cancelled(item) then
+        return true
+    end
+    local estimated = tonumber(decode_payload(item)['estimated_tokens']) or 0
+    return estimated <= slot_tokens or (max_slot_tokens >= 0 and estimated > max_slot_tokens)
+end
+
+local blocked = 0
+local function pop_next()
+    for p = 13, #ARGV do
+        local priority = ARGV[p]
+        local rotation = prefix .. ':rotation:' .. priority
+        local turns = prefix .. ':turns:' .. priority
+        local position = 0
+        while position < redis.call('LLEN', rotation) do
+            local tenant = redis.call('LINDEX', rotation, position)
+            local queue = prefix .. ':' .. priority .. ':' .. tenant
+            local head = redis.call('ZRANGE', queue, 0, 0, 'WITHSCORES')
+            if #head == 0 then
+                redis.call('LREM', rotation, 1, tenant)
+                redis.call('SREM', prefix .. ':tenants:' .. priority, tenant)
+                redis.call('HDEL', turns, tenant)
+            elseif not can_take(head[1], tonumber(head[2])) then
+                blocked = blocked + 1
+                position = position + 1
+            else
+                redis.call('ZREM', queue, head[1])
+                redis.call('HDEL', KEYS[3], decode_payload(head[1])['id'])
+                redis.call('HINCRBY', prefix .. ':pending', priority, -1)
+                if redis.call('HINCRBY', turns, tenant, 1) >= (tonumber(weights[tenant]) or 1) then
+                    redis.call('HDEL', turns, tenant)
+                    redis.call('LREM', rotation, 1, tenant)
+                    redis.call('RPUSH', rotation, tenant)
+                end
+                return head[1], tonumber(head[2])
+            end
+        end
+    end
+    return nil
+end
+
+local claimed, expired, exhausted, cancelled = {}, {}, {}, {}
+local count, tokens, taken_over = 0, 0, 0
+local function has_room()
+    return count < max_count and (token_budget < 0 or tokens < token_budget)
+end
+local function claim(item)
+    tokens = tokens + (tonumber(decode_payload(item)['estimated_tokens']) or 0)
+    table.insert(claimed, item)
+end
+
+for _, pending in ipairs(redis.call('XPENDING', stream, group, 'IDLE', ARGV[5], '-', '+', max_count)) do
+    if not has_room() then
+        break
+    end
+    local entry_id, deliveries = pending[1], tonumber(pending[4])
+    count = count + 1
+    if deliveries >= tonumber(ARGV[6]) then
+        local entry = redis.call('XRANGE', stream, entry_id, entry_id)[1]
+        redis.call('XACK', stream, group, entry_id)
+        redis.call('XDEL', stream, entry_id)
+        if entry then
+            redis.call('HDEL', KEYS[1], decode_payload(entry[2][2])['id'])
+            table.insert(exhausted, entry[2][2])
+        end
+    else
+        local entry = redis.call('XCLAIM', stream, group, consumer, ARGV[5], entry_id)[1]
+        if entry and is_cancelled(entry[2][2]) then
+            redis.call('XACK', stream, group, entry_id)
+            redis.call('XDEL', stream, entry_id)
+            redis.call('HDEL', KEYS[1], decode_payload(entry[2][2])['id'])
+            table.insert(cancelled, entry[2][2])
+        elseif entry then
+            taken_over = taken_over + 1
+            claim(entry[2][2])
+        else
+            redis.call('XACK', stream, group, entry_id)
+        end
+    end
+end
+
+local added = 0
+while has_room() do
+    local item, deadline = pop_next()
+    if not item then
+        break
+    end
+    count = count + 1
+    if is_cancelled(item) then
+        table.insert(cancelled, item)
+    elseif deadline < now then
+        table.insert(expired, item)
+    else
+        local entry_id = redis.call('XADD', stream, '*', 'request', item)
+        redis.call('HSET', KEYS[1], decode_payload(item)['id'], entry_id)
+        added = added + 1
+        claim(item)
+    end
+end
+if added > 0 then
+    redis.call('XREADGROUP', 'GROUP', group, consumer, 'COUNT', added, 'STREAMS', stream, '>')
+end
+return {claimed, expired, exhausted, taken_over, cancelled, blocked}
+"""
+
+# KEYS: inflight, dispatch_stream  ARGV: group, request_id
+COMPLETE_REQUEST_SCRIPT = """
+local entry_id = redis.call('HGET', KEYS[1], ARGV[2])
+if not entry_id then
+    return 0
+end
+redis.call('XACK', KEYS[2], ARGV[1], entry_id)
+redis.call('XDEL', KEYS[2], entry_id)
+return redis.call('HDEL', KEYS[1], ARGV[2])
+"""
+
+# Put an in-flight request back in its queue without counting a delivery.
+# KEYS: inflight, dispatch_stream, queued  ARGV: queue_prefix, group, request_id
+RELEASE_REQUEST_SCRIPT = PUSH_REQUEST_LUA + """
+local entry_id = redis.call('HGET', KEYS[1], ARGV[3])
+if not entry_id then
+    return 0
+end
+local entry = redis.call('XRANGE', KEYS[2], entry_id, entry_id)[1]
+redis.call('XACK', KEYS[2], ARGV[2], entry_id)
+redis.call('XDEL', KEYS[2], entry_id)
+redis.call('HDEL', KEYS[1], ARGV[3])
+if entry then
+    push_request(ARGV[1], KEYS[3], entry[2][2])
+end
+return 1
+"""
+
+# Reset the idle time of entries this consumer still owns, so long generations are not
+# taken over. Entries another consumer already took over are left alone.
+# KEYS: inflight, dispatch_stream  ARGV: group, consumer, request_ids...
+RENEW_LEASES_SCRIPT = """
+local renewed = 0
+for i = 3, #ARGV do
+    local entry_id = redis.call('HGET', KEYS[1], ARGV[i])
+    if entry_id then
+        local pending = redis.call('XPENDING', KEYS[2], ARGV[1], entry_id, entry_id, 1)[1]
+        if pending and pending[2] == ARGV[2] then
+            redis.call('XCLAIM', KEYS[2], ARGV[1], ARGV[2], 0, entry_id, 'JUSTID')
+            renewed = renewed + 1
+        end
+    end
+end
+return renewed
+"""
+
+# Remove this consumer from the group, but only when it holds no pending entries.
+# KEYS: dispatch_stream  ARGV: group, consumer
+REMOVE_CONSUMER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if #redis.call('XPENDING', KEYS[1], ARGV[1], '-', '+', 1, ARGV[2]) > 0 then
+    return 0
+end
+return redis.call('XGROUP', 'DELCONSUMER', KEYS[1], ARGV[1], ARGV[2])
+"""
+
+# Take a slot on the preferred worker if it has one free, else on the least-loaded worker that does.
+# Workers whose per-slot context (context / slots) cannot hold required_tokens are skipped, and
+# so are workers whose heartbeat key (<heartbeat_prefix><url>) expired and the excluded worker.
+# KEYS: worker_load, worker_slots, worker_context
+# ARGV: default_slots, default_context, preferred_worker (may be empty), required_tokens, heartbeat_prefix,
+#       excluded_worker (may be empty)
+ACQUIRE_SLOT_SCRIPT = """
+local function try_acquire(worker, load)
+    if worker == ARGV[6] or redis.call('EXISTS', ARGV[5] .. worker) == 0 then
+        return false
+    end
+    local slots = tonumber(redis.call('HGET', KEYS[2], worker) or ARGV[1])
+    local context = tonumber(redis.call('HGET', KEYS[3], worker) or ARGV[2])
+    if tonumber(load) < slots and math.floor(context / slots) >= tonumber(ARGV[4]) then
+        redis.call('ZINCRBY', KEYS[1], 1, worker)
+        return true
+    end
+    return false
+end
+
+if ARGV[3] ~= '' then
+    local load = redis.call('ZSCORE', KEYS[1], ARGV[3])
+    if load and try_acquire(ARGV[3], load) then
+        return ARGV[3]
+    end
+end
+local workers = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+for i = 1, #workers, 2 do
+    if try_acquire(workers[i], workers[i + 1]) then
+        return workers[i]
+    end
+end
+return false
+"""
+
+# Only touch workers that are still registered, and never go below zero.
+# KEYS: worker_load  ARGV: worker_url
+RELEASE_SLOT_SCRIPT = """
+local load = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if load and tonumber(load) > 0 then
+    redis.call('ZINCRBY', KEYS[1], -1, ARGV[1])
+end
+return 0
+"""
+
+# Returns {workers, busy workers, total slots, used slots, free slot tokens, largest slot context,
+# largest context of a free slot}, counting only workers with a live heartbeat.
+WORKER_STATS_LUA = """
+local function worker_stats(load_key, slots_key, context_key, default_slots, default_context, heartbeat_prefix)
+    local workers = redis.call('ZRANGE', load_key, 0, -1, 'WITHSCORES')
+    local alive, busy, total, used, free_tokens, max_slot_context, max_free_slot_context = 0, 0, 0, 0, 0, 0, 0
+    for i = 1, #workers, 2 do
+        if redis.call('EXISTS', heartbeat_prefix .. workers[i]) == 1 then
+            alive = alive + 1
+            local load = tonumber(workers[i + 1])
+            local slots = tonumber(redis.call('HGET', slots_key, workers[i]) or default_slots)
+            local slot_context = math.floor(tonumber(redis.call('HGET', context_key, workers[i]) or default_context) / slots)
+            total = total + slots
+            used = used + load
+            free_tokens = free_tokens + math.max(slots - load, 0) * slot_context
+            max_slot_context = math.max(max_slot_context, slot_context)
+            if load < slots then
+                max_free_slot_context = math.max(max_free_slot_context, slot_context)
+            end
+            if load > 0 then
+                busy = busy + 1
+            end
+        end
+    end
+    return {alive, busy, total, used, free_tokens, max_slot_context, max_free_slot_context}
+end
+"""
+
+# KEYS: worker_load, worker_slots, worker_context  ARGV: default_slots, default_context, heartbeat_prefix
+WORKER_STATS_SCRIPT = WORKER_STATS_LUA + """
+return worker_stats(KEYS[1], KEYS[2], KEYS[3], ARGV[1], ARGV[2], ARGV[3])
+"""
+
+# Worker stats followed by the in-flight count (entries left in the model's dispatch stream)
+# and the flattened pending-per-priority hash.
+# KEYS: worker_load, worker_slots, worker_context, dispatch_stream, pending
+# ARGV: default_slots, default_context, heartbeat_prefix
+QUEUE_STATS_SCRIPT = WORKER_STATS_LUA + """
+local stats = worker_stats(KEYS[1], KEYS[2], KEYS[3], ARGV[1], ARGV[2], ARGV[3])
+table.insert(stats, redis.call('XLEN', KEYS[4]))
+for _, value in ipairs(redis.call('HGETALL', KEYS[5])) do
+    table.insert(stats, value)
+end
+return stats
+"""
+
+# Drop registrations of workers whose heartbeat key expired, and the model itself once it
+# has no registered workers left; returns the newly evicted URLs. A worker's load entry is
+# kept while requests still hold its slots, so a worker that comes back after a heartbeat
+# blip (its registration only adds the entry if missing) resumes with its real load, and
+# releases of the old requests still count down.
+# KEYS: worker_load, worker_slots, worker_context, worker_models, worker_load_drift
+# ARGV: heartbeat_prefix, model
+EVICT_DEAD_WORKERS_SCRIPT = """
+local evicted = {}
+local workers = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+for i = 1, #workers, 2 do
+    local worker = workers[i]
+    if redis.call('EXISTS', ARGV[1] .. worker) == 0 then
+        if tonumber(workers[i + 1]) <= 0 then
+            redis.call('ZREM', KEYS[1], worker)
+        end
+        redis.call('HDEL', KEYS[3], worker)
+        redis.call('HDEL', KEYS[5], worker)
+        if redis.call('HDEL', KEYS[2], worker) == 1 then
+            table.insert(evicted, worker)
+        end
+    end
+end
+if redis.call('HLEN', KEYS[2]) == 0 then
+    redis.call('SREM', KEYS[4], ARGV[2])
+end
+return evicted
+"""
+
+# Correct worker_load drift, e.g. slots leaked by an API process that died mid-request,
+# against the busy slots each worker reports in its heartbeat. A difference is only
+# corrected once two consecutive heartbeats show it with the same sign, and by the smaller
+# of the two, so slots reserved just before the request reaches llama-server, or released
+# just after it finished, are not mistaken for drift. Returns {url, correction, ...}.
+# KEYS: worker_load, worker_load_drift  ARGV: heartbeat_prefix
+RECONCILE_WORKER_LOAD_SCRIPT = """
+local corrected = {}
+local workers = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+for i = 1, #workers, 2 do
+    local worker, load = workers[i], tonumber(workers[i + 1])
+    local heartbeat = redis.call('GET', ARGV[1] .. worker)
+    local ok, beat = pcall(cjson.decode, heartbeat or '')
+    local processing = ok and type(beat) == 'table' and beat['slots_processing']
+    if type(processing) ~= 'number' then
+        redis.call('HDEL', KEYS[2], worker)
+    else
+        local previous = cjson.decode(redis.call('HGET', KEYS[2], worker) or '{}')
+        local sampled_at = tostring(beat['timestamp'])
+        if previous['timestamp'] ~= sampled_at then
+            local drift = processing - load
+            local correction = 0
+            local last = tonumber(previous['drift']) or 0
+            if drift > 0 and last > 0 then
+                correction = math.min(drift, last)
+            elseif drift < 0 and last < 0 then
+                correction = math.max(drift, last)
+            end
+            if correction ~= 0 then
+                redis.call('ZINCRBY', KEYS[1], correction, worker)
+                table.insert(corrected, worker)
+                table.insert(corrected, correction)
+            end
+            redis.call('HSET', KEYS[2], worker, cjson.encode({timestamp = sampled_at, drift = drift - correction}))
+        end
+    end
+end
+return corrected
+"""
+
+# Become the leader for an identical request, or attach to the existing one and return its
+# request_id. Callers waiting on a leader's generation, its own included, are counted in
+# <waiters_prefix><leader_id>, which only ever lives longer with each attach.
+# KEYS: coalesce_key  ARGV: request_id, ttl_seconds, waiters_prefix
+CLAIM_COALESCE_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if leader then
+    local waiters = ARGV[3] .. leader
+    redis.call('INCR', waiters)
+    if redis.call('TTL', waiters) < tonumber(ARGV[2]) then
+        redis.call('EXPIRE', waiters, ARGV[2])
+    end
+    return leader
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SET', ARGV[3] .. ARGV[1], 1, 'EX', ARGV[2])
+return false
+"""
+
+# One caller stops waiting on a request; returns how many still wait on its generation,
+# 0 when nobody else does, including for requests nothing was ever coalesced with.
+# KEYS: waiters_key
+LEAVE_REQUEST_SCRIPT = """
+local remaining = redis.call('DECR', KEYS[1])
+if remaining <= 0 then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+return remaining
+"""
+
+# Delete the key only if it still points at this request.
+# KEYS: coalesce_key  ARGV: request_id
+RELEASE_COALESCE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+DEFAULT_WORKER_SLOTS = 8
+DEFAULT_WORKER_CONTEXT = 4096
+# Worker stats that are maxima rather than sums across pools
+MAX_STATS = ("max_slot_context", "max_free_slot_context")
+# How long ingest trusts its copy of the registered models before reading the set again
+MODEL_REGISTRY_TTL = 5
 
 @lru_cache()
 def get_redis_pool():
@@ -12,98 +488,505 @@ def get_redis_pool():
         decode_responses=True,
     )
 
+@lru_cache()
+def get_binary_redis_pool():
+    """
+    Connection pool without response decoding, for queue payloads, results and stream chunks:
+    they are encoded with app.services.wire and never need decoding to str first.
+    """
+    return redis.from_url(settings.redis_url)
+
 class RedisQueueManager:
     def __init__(self):
         self.redis = get_redis_pool()
-        self.request_queue = "vlm_request_queue"
-        self.processing_queue = "vlm_processing_queue"
+        self.binary_redis = get_binary_redis_pool()
+        self.queue_prefix = "vlm_request_queue"
+        self.inflight_requests = "vlm_inflight"
+        self.queued_requests = "vlm_queued"
+        self.dispatch_stream = "vlm_dispatch"
+        self.dispatch_group = "vlm_dispatchers"
+        self.consumer_name = settings.queue_consumer_name or f"{socket.gethostname()}-{os.getpid()}"
         self.result_prefix = "vlm_result:"
+        self.result_channel = "vlm_results"
+        self.stream_prefix = "vlm_stream:"
+        self.cancel_prefix = "vlm_cancelled:"
+        self.cancel_channel = "vlm_cancellations"
         self.batch_lock = "vlm_batch_lock"
+        self.worker_slots_key = "worker_slots"
+        self.worker_load_key = "worker_load"
+        self.worker_context_key = "worker_context"
+        self.worker_load_drift_key = "worker_load_drift"
+        self.worker_models_key = "worker_models"
+        # Set by each worker with a short TTL while its llama-server is healthy
+        self.worker_heartbeat_prefix = "worker_heartbeat:"
+        self.coalesce_prefix = "vlm_coalesce:"
+        # Keyed by the leader's request_id rather than the hash, so DELETE /requests/{id} finds it
+        self.coalesce_waiters_prefix = "vlm_coalesce_waiters:"
+        # Bulk jobs: vlm_job:<id> hash of job metadata, vlm_job:<id>:results list of finished results
+        self.job_prefix = "vlm_job:"
+
+        self._tenant_weights = json.dumps({
+            tenant_id(api_key): weight for api_key, weight in settings.tenant_weights.items()
+        })
+
+        # Scripts that take or return payloads run on the binary connection
+        self._enqueue_request = self.binary_redis.register_script(ENQUEUE_REQUEST_SCRIPT)
+        self._claim_batch = self.binary_redis.register_script(CLAIM_BATCH_SCRIPT)
+        self._complete_request = self.redis.register_script(COMPLETE_REQUEST_SCRIPT)
+        self._release_request = self.binary_redis.register_script(RELEASE_REQUEST_SCRIPT)
+        self._renew_leases = self.redis.register_script(RENEW_LEASES_SCRIPT)
+        self._remove_consumer = self.redis.register_script(REMOVE_CONSUMER_SCRIPT)
+        self._acquire_slot = self.redis.register_script(ACQUIRE_SLOT_SCRIPT)
+        self._release_slot = self.redis.register_script(RELEASE_SLOT_SCRIPT)
+        self._evict_dead_workers = self.redis.register_script(EVICT_DEAD_WORKERS_SCRIPT)
+        self._reconcile_worker_load = self.redis.register_script(RECONCILE_WORKER_LOAD_SCRIPT)
+        self._worker_stats = self.redis.register_script(WORKER_STATS_SCRIPT)
+        self._queue_stats = self.redis.register_script(QUEUE_STATS_SCRIPT)
+        self._claim_coalesce = self.redis.register_script(CLAIM_COALESCE_SCRIPT)
+        self._release_coalesce = self.redis.register_script(RELEASE_COALESCE_SCRIPT)
+        self._leave_request = self.redis.register_script(LEAVE_REQUEST_SCRIPT)
+
+        self._models: Set[str] = set()
+        self._models_read_at = 0.0
+
+    def model_queue_prefix(self, model: str) -> str:
+        return f"{self.queue_prefix}:{model}"
+
+    def model_dispatch_stream(self, model: str) -> str:
+        return f"{self.dispatch_stream}:{model}"
+
+    def model_worker_keys(self, model: str) -> List[str]:
+        """[worker_load, worker_slots, worker_context] keys of the model's worker pool"""
+        return [f"{self.worker_load_key}:{model}", f"{self.worker_slots_key}:{model}", f"{self.worker_context_key}:{model}"]
+
+    async def get_models(self, refresh: bool = False) -> Set[str]:
+        """
+        Models with registered workers plus settings.served_models. Read at most every
+        MODEL_REGISTRY_TTL seconds, since ingest checks every request against it.
+        """
+        if refresh or time.monotonic() - self._models_read_at > MODEL_REGISTRY_TTL:
+            self._models = set(await self.redis.smembers(self.worker_models_key))
+            self._models_read_at = time.monotonic()
+        return self._models | set(settings.served_models)
     
-    async def enqueue_request(self, request_data: Dict[str, Any], request_id: str):
-        payload = {
+    async def enqueue_request(
+        self,
+        request_data: Dict[str, Any],
+        request_id: str,
+        priority: str = DEFAULT_PRIORITY,
+        tenant: str = DEFAULT_TENANT,
+        deadline_ms: Optional[int] = None
+    ):
+        payload = self._queue_payload(request_data, request_id, priority, tenant, deadline_ms)
+        await self._enqueue_request(
+            keys=[self.queued_requests],
+            args=[self.model_queue_prefix(request_data["model"]), encode_payload(payload)]
+        )
+        return request_id
+
+    def _queue_payload(self, request_data: Dict[str, Any], request_id: str, priority: str, tenant: str, deadline_ms: Optional[int]) -> Dict[str, Any]:
+        now_ms = int(time.time() * 1000)
+        return {
             "id": request_id,
             "data": request_data,
-            "timestamp": int(time.time() * 1000),
-            "retry_count": 0
+            "timestamp": now_ms,
+            "retry_count": 0,
+            "priority": priority,
+            "tenant": tenant,
+            "deadline": deadline_ms or now_ms + DEFAULT_DEADLINE_MS,
+            "estimated_tokens": estimate_request_tokens(request_data)
         }
 
-        await self.redis.lpush(self.request_queue, json.dumps(payload))
-        return request_id
+    async def enqueue_job(
+        self,
+        job_id: str,
+        requests: Dict[str, Dict[str, Any]],
+        priorities: Dict[str, str],
+        tenant: str,
+        deadline_ms: int
+    ):
+        """
+        Record a bulk job and enqueue all of its requests (request_id -> request_data, each
+        carrying job_id) in one pipeline. Results are appended to the job's result list.
+        """
+        ttl = max(1, deadline_ms // 1000 - int(time.time())) + settings.batch_job_result_ttl
+        job_key = f"{self.job_prefix}{job_id}"
+        async with self.binary_redis.pipeline(transaction=False) as pipe:
+            pipe.hset(job_key, mapping={"total": len(requests), "created": time.time()})
+            pipe.expire(job_key, ttl)
+            for request_id, request_data in requests.items():
+                payload = self._queue_payload(request_data, request_id, priorities[request_id], tenant, deadline_ms)
+                await self._enqueue_request(
+                    keys=[self.queued_requests],
+                    args=[self.model_queue_prefix(request_data["model"]), encode_payload(payload)],
+                    client=pipe
+                )
+            await pipe.execute()
+
+    async def get_job(self, job_id: str, cursor: int = 0) -> Optional[Dict[str, Any]]:
+        """The job's size, finished count and the results from position cursor on, or None if unknown"""
+        results_key = f"{self.job_prefix}{job_id}:results"
+        async with self.binary_redis.pipeline(transaction=False) as pipe:
+            pipe.hget(f"{self.job_prefix}{job_id}", "total")
+            pipe.llen(results_key)
+            pipe.lrange(results_key, cursor, -1)
+            total, completed, results = await pipe.execute()
+        if total is None:
+            return None
+        return {
+            "total": int(total),
+            "completed": completed,
+            "results": [decode_payload(result) for result in results]
+        }
     
-    async def dequeue_batch_with_timeout(self, batch_size: int = 4, timeout_ms: int = 500) -> List[Dict]:
+    async def dequeue_batch_with_timeout(
+        self,
+        model: str,
+        batch_size: int = 4,
+        timeout_ms: float = 500,
+        token_budget: Optional[int] = None,
+        slot_tokens: Optional[int] = None,
+        max_slot_tokens: Optional[int] = None
+    ) -> List[Dict]:
         """
-        1. process imidiately when batch is full (batch_size items)
+        1. process imidiately when batch is full (batch_size items, or token_budget used up)
         2. process after timeout (timeout_ms) even if batch is not full
+        Everything already queued is claimed in one script call, after taking over requests
+        other consumers stopped renewing. Requests whose deadline has already passed, that
+        were delivered too often or that were cancelled are failed here instead of being returned.
+        Requests needing more than slot_tokens are left queued; when only such requests are
+        waiting, an empty batch is returned so the caller can re-read its free slots. Those
+        needing more than max_slot_tokens fit no slot at all and are returned for failing.
         """
+        queue_prefix = self.model_queue_prefix(model)
         batch = []
+        batch_tokens = 0
         start_time = time.time() * 1000
 
-        while len(batch) < batch_size:
+        while len(batch) < batch_size and (token_budget is None or batch_tokens < token_budget):
+            requested = batch_size - len(batch)
+            claimed, expired, exhausted, taken_over, cancelled, blocked = await self._claim_batch(
+                keys=[self.inflight_requests, self.model_dispatch_stream(model), self.queued_requests],
+                args=[
+                    queue_prefix, self.dispatch_group, self.consumer_name, int(time.time() * 1000),
+                    VISIBILITY_TIMEOUT_MS, MAX_RETRIES + 1, self._tenant_weights,
+                    requested, -1 if token_budget is None else token_budget - batch_tokens,
+                    self.cancel_prefix, -1 if slot_tokens is None else slot_tokens,
+                    -1 if max_slot_tokens is None else max_slot_tokens, *PRIORITIES
+                ]
+            )
+
+            failed = {}
+            job_ids = {}
+            streamed = set()
+            for items, content, stop_type in (
+                (expired, "Request deadline passed before it could be scheduled", "deadline_exceeded"),
+                (exhausted, "Error processing request: retries exhausted", "error"),
+                (cancelled, "", "cancelled")
+            ):
+                for item in items:
+                    request = decode_payload(item)
+                    failed[request["id"]] = (content, stop_type)
+                    if request["data"].get("job_id"):
+                        job_ids[request["id"]] = request["data"]["job_id"]
+                    if request["data"].get("stream"):
+                        streamed.add(request["id"])
+            if taken_over:
+                REQUESTS_REQUEUED.labels("taken_over").inc(taken_over)
+            if expired:
+                REQUESTS_FAILED.labels("deadline_exceeded").inc(len(expired))
+            if exhausted:
+                REQUESTS_FAILED.labels("retries_exhausted").inc(len(exhausted))
+            if cancelled:
+                REQUESTS_FAILED.labels("cancelled").inc(len(cancelled))
+            if failed:
+                await self.store_results({
+                    request_id: {
+                        "content": content,
+                        "tokens_predicted": 0,
+                        "tokens_evaluated": 0,
+                        "stop": True,
+                        "stop_type": stop_type
+                    }
+                    for request_id, (content, stop_type) in failed.items()
+                }, job_ids, streamed)
+            for item in claimed:
+                request = decode_payload(item)
+                batch.append(request)
+                batch_tokens += request["estimated_tokens"]
+
+            # A short answer means the queue ran dry; a full one means there may be more
+            if len(claimed) + len(expired) + len(exhausted) + len(cancelled) == requested:
+                continue
+
             elapsed_time = (time.time() * 1000) - start_time
             remaining_timeout = max(0, timeout_ms - elapsed_time)
-
-            if remaining_timeout <=0 and batch:
+            if remaining_timeout <= 0 and batch:
                 break
 
-            result = await self.redis.brpoplpush(
-                self.request_queue,
-                self.processing_queue,
-                timeout=max(0.5, remaining_timeout / 1000)  # Convert to seconds
+            # Block until something is enqueued: indefinitely in 0.5 s steps for the
+            # first request, only for the remaining window once a batch is open
+            ready = await self.redis.blpop(
+                f"{queue_prefix}:signal",
+                timeout=max(0.5 if not batch else 0.01, remaining_timeout / 1000)  # Convert to seconds
             )
-
-            if result:
-                batch.append(json.loads(result))
-                if len(batch) == batch_size:
-                    break
-            else:
-                if batch:
-                    break
-                else:
-                    continue
+            if not ready and batch:
+                break
+            if blocked and not batch:
+                # Only requests too large for the free slots are waiting: return, so the
+                # caller re-reads which slots are free before claiming again
+                break
         return batch
     
-    async def store_result(self, request_id: str, result: Dict[str, Any]):
-        result_key = f"{self.result_prefix}{request_id}"
-        await self.redis.setex(
-            result_key, 
-            300, 
-            json.dumps(result)
-        )
+    async def store_result(self, request_id: str, result: Dict[str, Any], job_id: Optional[str] = None):
+        """Store the result and notify waiting API processes in a single round trip"""
+        await self.store_results({request_id: result}, {request_id: job_id} if job_id else None)
+
+    async def store_results(
+        self,
+        results: Dict[str, Dict[str, Any]],
+        job_ids: Optional[Dict[str, str]] = None,
+        streamed: Optional[Set[str]] = None
+    ):
+        """
+        Store and publish any number of results in one pipeline. Results of bulk job requests
+        (job_ids maps request_id -> job_id) are appended to their job's result list instead,
+        with one notification per job. Requests in streamed also get the result as the final
+        chunk of their stream, which is what their client reads.
+        """
+        job_ids = job_ids or {}
+        streamed = streamed or set()
+        notified_jobs = set()
+        async with self.binary_redis.pipeline(transaction=False) as pipe:
+            for request_id, result in results.items():
+                if request_id in streamed:
+                    self._append_stream_chunk(pipe, request_id, {**result, "final": True})
+                job_id = job_ids.get(request_id)
+                if job_id:
+                    results_key = f"{self.job_prefix}{job_id}:results"
+                    pipe.rpush(results_key, encode_payload({**result, "request_id": request_id}))
+                    pipe.expire(results_key, settings.batch_job_result_ttl)
+                    notified_jobs.add(job_id)
+                    continue
+                pipe.setex(f"{self.result_prefix}{request_id}", 300, encode_payload(result))
+                pipe.publish(self.result_channel, encode_payload({"id": request_id, "result": result}))
+            for job_id in notified_jobs:
+                pipe.publish(self.result_channel, encode_payload({"id": job_id, "result": {}}))
+            await pipe.execute()
 
     async def get_result(self, request_id: str) -> Optional[Dict[str, Any]]:
         result_key = f"{self.result_prefix}{request_id}"
-        result = await self.redis.get(result_key)
-        return json.loads(result) if result else None
-    
-    async def mark_request_completed(self, request_id: str):
-        processing_items = await self.redis.lrange(self.processing_queue, 0, -1)
-        
-        for item in processing_items:
-            request_data = json.loads(item)
-            if request_data.get("id") == request_id:
-                await self.redis.lrem(self.processing_queue, 1, item)
-                break
+        result = await self.binary_redis.get(result_key)
+        return decode_payload(result) if result else None
     
-    async def requeue_failed_requests(self):
-        current_time = int(time.time() * 1000)
-        processing_items = await self.redis.lrange(self.processing_queue, 0, -1)
-        
-        for item in processing_items:
-            request_data = json.loads(item)
-            if current_time - request_data["timestamp"] > 120000:
-                request_data["retry_count"] += 1
-                if request_data["retry_count"] < 2:  # Max 2 retries
-                    await self.redis.lrem(self.processing_queue, 1, item)
-                    await self.redis.rpush(self.request_queue, json.dumps(request_data))
-
-    async def get_queue_stats(self) -> Dict[str, int]:
+    async def append_stream_chunk(self, request_id: str, chunk: Dict[str, Any]):
+        """Append a generated chunk to the per-request stream read by the API process holding the client"""
+        async with self.binary_redis.pipeline(transaction=False) as pipe:
+            self._append_stream_chunk(pipe, request_id, chunk)
+            await pipe.execute()
+
+    def _append_stream_chunk(self, pipe, request_id: str, chunk: Dict[str, Any]):
+        stream_key = f"{self.stream_prefix}{request_id}"
+        pipe.xadd(stream_key, {"data": encode_payload(chunk)}, maxlen=4096, approximate=True)
+        pipe.expire(stream_key, 300)
+
+    async def read_stream_chunks(self, request_id: str, last_id: str = "0", block_ms: int = 1000) -> List[tuple]:
+        """Return [(entry_id, chunk), ...] appended after last_id, blocking up to block_ms"""
+        stream_key = f"{self.stream_prefix}{request_id}"
+        response = await self.binary_redis.xread({stream_key: last_id}, block=block_ms)
+        if not response:
+            return []
+        return [(entry_id.decode(), decode_payload(fields[b"data"])) for entry_id, fields in response[0][1]]
+
+    async def delete_stream(self, request_id: str):
+        await self.redis.delete(f"{self.stream_prefix}{request_id}")
+
+    async def cancel_request(self, request_id: str):
+        """
+        Record the cancellation, so dequeue skips the request if it is still queued, and
+        announce it so the dispatcher running it can abort the worker call. The record of a
+        queued request is kept past its deadline, however long (bulk jobs) it may still wait.
+        """
+        ttl = CANCEL_MARKER_TTL
+        deadline_ms = await self.redis.hget(self.queued_requests, request_id)
+        if deadline_ms:
+            ttl += max(0, int(deadline_ms) // 1000 - int(time.time()))
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.setex(f"{self.cancel_prefix}{request_id}", ttl, 1)
+            pipe.publish(self.cancel_channel, request_id)
+            await pipe.execute()
+
+    async def request_exists(self, request_id: str) -> bool:
+        """Whether the request is queued, being generated or has a stored result"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hexists(self.queued_requests, request_id)
+            pipe.hexists(self.inflight_requests, request_id)
+            pipe.exists(f"{self.result_prefix}{request_id}")
+            return any(await pipe.execute())
+
+    async def get_cancelled(self, request_ids: List[str]) -> List[str]:
+        """The subset of request_ids that were cancelled, in one pipeline"""
+        if not request_ids:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for request_id in request_ids:
+                pipe.exists(f"{self.cancel_prefix}{request_id}")
+            flags = await pipe.execute()
+        return [request_id for request_id, flag in zip(request_ids, flags) if flag]
+
+    async def mark_request_completed(self, request_id: str, model: str):
+        await self._complete_request(
+            keys=[self.inflight_requests, self.model_dispatch_stream(model)],
+            args=[self.dispatch_group, request_id]
+        )
+
+    async def release_request(self, request_id: str, model: str):
+        """Return a claimed request to its queue, e.g. when no worker took it"""
+        await self._release_request(
+            keys=[self.inflight_requests, self.model_dispatch_stream(model), self.queued_requests],
+            args=[self.model_queue_prefix(model), self.dispatch_group, request_id]
+        )
+
+    async def renew_leases(self, model: str, request_ids: List[str]) -> int:
+        """Keep requests this consumer is still working on from being taken over"""
+        if not request_ids:
+            return 0
+        return await self._renew_leases(
+            keys=[self.inflight_requests, self.model_dispatch_stream(model)],
+            args=[self.dispatch_group, self.consumer_name, *request_ids]
+        )
+
+    async def remove_consumer(self, model: str):
+        """Leave the model's consumer group on shutdown, unless requests are still pending on us"""
+        await self._remove_consumer(
+            keys=[self.model_dispatch_stream(model)],
+            args=[self.dispatch_group, self.consumer_name]
+        )
+
+    async def claim_coalesce_key(self, request_hash: str, request_id: str, ttl: int) -> Optional[str]:
+        """
+        Returns the request_id already generating this exact request, counting us as one more
+        caller waiting on it, or None if we are first
+        """
+        return await self._claim_coalesce(
+            keys=[f"{self.coalesce_prefix}{request_hash}"],
+            args=[request_id, ttl, self.coalesce_waiters_prefix]
+        )
+
+    async def release_coalesce_key(self, request_hash: str, request_id: str):
+        await self._release_coalesce(keys=[f"{self.coalesce_prefix}{request_hash}"], args=[request_id])
+
+    async def leave_request(self, request_id: str) -> int:
+        """
+        Stop waiting on a request; returns how many coalesced callers still wait on its
+        generation. Only once that is 0 may the request be cancelled.
+        """
+        return await self._leave_request(keys=[f"{self.coalesce_waiters_prefix}{request_id}"])
+
+    async def acquire_worker_slot(
+        self,
+        model: str,
+        preferred_worker: Optional[str] = None,
+        required_tokens: int = 0,
+        excluded_worker: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Reserve one slot in the model's pool, on preferred_worker if it has capacity, otherwise on the
+        least-loaded worker other than excluded_worker whose slots are large enough for required_tokens.
+        Returns the worker URL or None if no suitable slot is free.
+        """
+        return await self._acquire_slot(
+            keys=self.model_worker_keys(model),
+            args=[
+                DEFAULT_WORKER_SLOTS, DEFAULT_WORKER_CONTEXT, preferred_worker or "", required_tokens,
+                self.worker_heartbeat_prefix, excluded_worker or ""
+            ]
+        )
+
+    async def release_worker_slot(self, model: str, worker_url: str):
+        await self._release_slot(keys=self.model_worker_keys(model)[:1], args=[worker_url])
+
+    async def evict_dead_workers(self, model: str) -> List[str]:
+        """Deregister the model's workers that stopped sending heartbeats and return their URLs"""
+        return await self._evict_dead_workers(
+            keys=[*self.model_worker_keys(model), self.worker_models_key, f"{self.worker_load_drift_key}:{model}"],
+            args=[self.worker_heartbeat_prefix, model]
+        )
+
+    async def reconcile_worker_load(self, model: str) -> Dict[str, int]:
+        """Correct the model's worker_load against its workers' heartbeats; returns {url: correction}"""
+        corrected = await self._reconcile_worker_load(
+            keys=[self.model_worker_keys(model)[0], f"{self.worker_load_drift_key}:{model}"],
+            args=[self.worker_heartbeat_prefix]
+        )
+        return dict(zip(corrected[::2], (int(correction) for correction in corrected[1::2])))
+
+    @staticmethod
+    def _worker_stats_dict(
+        workers: int, busy: int, total_slots: int, used_slots: int, free_tokens: int, max_slot_context: int,
+        max_free_slot_context: int
+    ) -> Dict[str, int]:
         return {
-            "pending_requests": await self.redis.llen(self.request_queue),
-            "processing_requests": await self.redis.llen(self.processing_queue),
-            "idle_workers": await self.redis.llen("idle_workers"),
-            "busy_workers": await self.redis.llen("busy_workers"),
-            "total_workers": await self.redis.llen("idle_workers") + await self.redis.llen("busy_workers")
+            "idle_workers": workers - busy,
+            "busy_workers": busy,
+            "total_workers": workers,
+            "total_slots": total_slots,
+            "busy_slots": used_slots,
+            "free_slot_tokens": free_tokens,
+            "max_slot_context": max_slot_context,
+            "max_free_slot_context": max_free_slot_context
         }
 
-redis_queue_manager = RedisQueueManager()
\ No newline at end of file
+    async def get_worker_stats(self, model: str) -> Dict[str, int]:
+        stats = await self._worker_stats(
+            keys=self.model_worker_keys(model),
+            args=[DEFAULT_WORKER_SLOTS, DEFAULT_WORKER_CONTEXT, self.worker_heartbeat_prefix]
+        )
+        return self._worker_stats_dict(*stats)
+
+    async def get_queue_stats(self, model: str) -> Dict[str, int]:
+        """The model's queue depth, in-flight count and worker stats in a single round trip"""
+        stats = await self._queue_stats(
+            keys=[
+                *self.model_worker_keys(model), self.model_dispatch_stream(model),
+                f"{self.model_queue_prefix(model)}:pending"
+            ],
+            args=[DEFAULT_WORKER_SLOTS, DEFAULT_WORKER_CONTEXT, self.worker_heartbeat_prefix]
+        )
+        return self._queue_stats_dict(stats)
+
+    def _queue_stats_dict(self, stats: List) -> Dict[str, int]:
+        pending = dict(zip(stats[8::2], (int(count) for count in stats[9::2])))
+        return {
+            "pending_requests": sum(pending.values()),
+            **{f"pending_{priority}": pending.get(priority, 0) for priority in PRIORITIES},
+            "processing_requests": stats[7],
+            **self._worker_stats_dict(*stats[:7])
+        }
+
+    async def get_model_queue_stats(self) -> Dict[str, Dict[str, int]]:
+        """get_queue_stats of every known model, in one pipeline"""
+        models = sorted(await self.get_models())
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for model in models:
+                await self._queue_stats(
+                    keys=[
+                        *self.model_worker_keys(model), self.model_dispatch_stream(model),
+                        f"{self.model_queue_prefix(model)}:pending"
+                    ],
+                    args=[DEFAULT_WORKER_SLOTS, DEFAULT_WORKER_CONTEXT, self.worker_heartbeat_prefix],
+                    client=pipe
+                )
+            results = await pipe.execute()
+        return {model: self._queue_stats_dict(stats) for model, stats in zip(models, results)}
+
+    @staticmethod
+    def total_stats(per_model: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+        """Sum per-model stats; the largest slot contexts are the largest of any pool"""
+        totals: Dict[str, int] = {}
+        for stats in per_model.values():
+            for key, value in stats.items():
+                totals[key] = max(totals.get(key, 0), value) if key in MAX_STATS else totals.get(key, 0) + value
+        return totals
+
+redis_queue_manager = RedisQueueManager()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import settings
+from app.services.redis_pool import get_redis_pool
+
+CACHE_KEY_FIELDS = ('model', 'messages', 'system_prompt', 'temperature', 'top_p', 'n_predict')
+UNCACHEABLE_STOP_TYPES = ('error', 'cancelled', 'context_exceeded', 'deadline_exceeded')
+
+def canonical_request_hash(request_data: dict) -> str:
+    """
+    Hash of the normalized request. Images are already vlm-image:<sha256> references
+    by the time this runs, so the hash covers image content without touching the bytes.
+    """
+    canonical = json.dumps(
+        {field: request_data.get(field) for field in CACHE_KEY_FIELDS},
+        sort_keys=True,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def is_deterministic(request_data: dict) -> bool:
+    return request_data.get('temperature') == 0
+
+class ResponseCache:
+    """
+    Opt-in cache for temperature-0 responses: an in-process LRU in front of a
+    shared Redis tier. Only successful generations are stored.
+    """
+    def __init__(self):
+        self.redis = get_redis_pool()
+        self.key_prefix = "vlm_response_cache:"
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def cache_key(self, request_data: dict) -> Optional[str]:
+        """None when caching is off or the request is not deterministic"""
+        if not settings.response_cache_enabled or not is_deterministic(request_data):
+            return None
+        return canonical_request_hash(request_data)
+
+    async def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+
+        entry = self._local.get(key)
+        if entry and entry[0] > time.time():
+            self._local.move_to_end(key)
+            self.local_hits += 1
+            return dict(entry[1])
+
+        cached = await self.redis.get(f"{self.key_prefix}{key}")
+        if cached:
+            result = json.loads(cached)
+            self._store_local(key, result)
+            self.redis_hits += 1
+            return result
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: Optional[str], result: Dict[str, Any]):
+        if key is None or result.get('stop_type') in UNCACHEABLE_STOP_TYPES:
+            return
+
+        # Timings describe the generation that produced the entry, not a later cache hit
+        result = {field: value for field, value in result.items() if field != 'timings'}
+        encoded = json.dumps(result)
+        if len(encoded) > settings.response_cache_max_bytes:
+            return
+
+        self._store_local(key, result)
+        await self.redis.setex(f"{self.key_prefix}{key}", settings.response_cache_ttl, encoded)
+
+    def _store_local(self, key: str, result: Dict[str, Any]):
+        self._local[key] = (time.time() + settings.response_cache_local_ttl, dict(result))
+        self._local.move_to_end(key)
+        while len(self._local) > settings.response_cache_local_size:
+            self._local.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "response_cache_local_hits": self.local_hits,
+            "response_cache_redis_hits": self.redis_hits,
+            "response_cache_misses": self.misses,
+            "response_cache_local_entries": len(self._local)
+        }
+
+response_cache = ResponseCache()
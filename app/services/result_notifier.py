@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional, Union
+
+from app.services.redis_pool import redis_queue_manager, get_binary_redis_pool
+from app.services.wire import decode_payload
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_POLL_INTERVAL = 5.0
+RECONNECT_DELAY = 1.0
+
+class ResultNotifier:
+    """
+    One shared pub/sub subscriber per API process.
+    store_result publishes every finished result on a single channel; the listener
+    resolves the future of the coroutine waiting on that request_id, if any.
+    """
+    def __init__(self):
+        self.redis = get_binary_redis_pool()
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._waiter_counts: Dict[str, int] = {}
+        self._listener_task = None
+        self._running = False
+
+    async def start(self):
+        if not self._listener_task:
+            self._running = True
+            self._listener_task = asyncio.create_task(self._listen_loop())
+            logger.info(f"Result notifier subscribed to {redis_queue_manager.result_channel}")
+
+    async def stop(self):
+        if self._listener_task:
+            self._running = False
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+            logger.info("Result notifier stopped")
+
+    def register(self, request_id: str) -> asyncio.Future:
+        """
+        Register interest in a result. Call before enqueueing so no notification is missed.
+        Several callers may wait on the same request_id; each must call unregister once.
+        """
+        future = self._waiters.get(request_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[request_id] = future
+        self._waiter_counts[request_id] = self._waiter_counts.get(request_id, 0) + 1
+        return future
+
+    def unregister(self, request_id: str):
+        remaining = self._waiter_counts.get(request_id, 0) - 1
+        if remaining > 0:
+            self._waiter_counts[request_id] = remaining
+            return
+
+        self._waiter_counts.pop(request_id, None)
+        future = self._waiters.pop(request_id, None)
+        if future and not future.done():
+            future.cancel()
+
+    async def wait_for_result(self, request_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for a pushed result. Pub/sub is at-most-once (e.g. during a reconnect), so
+        every FALLBACK_POLL_INTERVAL seconds the stored result is checked with a plain GET.
+        """
+        future = self._waiters.get(request_id) or self.register(request_id)
+        deadline = time.time() + timeout
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                # Copy: coalesced callers share one future and may annotate their result
+                return dict(await asyncio.wait_for(
+                    asyncio.shield(future),
+                    timeout=min(FALLBACK_POLL_INTERVAL, remaining)
+                ))
+            except asyncio.TimeoutError:
+                result = await redis_queue_manager.get_result(request_id)
+                if result:
+                    return result
+
+    async def _listen_loop(self):
+        while self._running:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(redis_queue_manager.result_channel)
+                while self._running:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Result subscriber error, reconnecting: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await pubsub.reset()
+
+    def _dispatch(self, data: Union[bytes, str]):
+        try:
+            message = decode_payload(data)
+        except ValueError:
+            logger.warning("Ignoring malformed result notification")
+            return
+
+        future = self._waiters.get(message.get("id"))
+        if future and not future.done():
+            future.set_result(message["result"])
+
+result_notifier = ResultNotifier()
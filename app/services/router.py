@@ -1,48 +1,433 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
 import asyncio
+import json
 import time
 import uuid
 
-from app.services.redis_pool import redis_queue_manager
+from app.services.redis_pool import redis_queue_manager, tenant_id
+from app.services.batch_manager import queue_processor
+from app.services.result_notifier import result_notifier
+from app.services.image_store import image_store
+from app.services.admission import admission_controller
+from app.services.response_cache import response_cache, canonical_request_hash, is_deterministic
+from app.services.metrics import END_TO_END_SECONDS
 from app.config import settings
-from app.model import ChatRequest, ChatResponse
+from app.model import BatchJob, BatchPredictRequest, ChatRequest, ChatResponse, JobResults
 
 router = APIRouter(prefix="/v1")
 
-@router.post("/predict", response_model=ChatResponse)
-async def predict(req: ChatRequest):
-    request_id = req.request_id or str(uuid.uuid4())
-    
-    request_data = req.model_dump()
-    request_data.pop('request_id', None)
+MAX_WAIT_TIME = 120
+DISCONNECT_CHECK_INTERVAL = 1.0
+# A stream keeps reading this long past its deadline, so the dispatcher's deadline_exceeded
+# summary still reaches the client instead of a bare timeout event
+STREAM_DEADLINE_GRACE = 2.0
+JOB_MAX_WAIT = 60
+# Results that mean no generation will arrive for the caller
+FAILED_STOP_TYPES = ("deadline_exceeded", "cancelled", "context_exceeded")
+# A coalescing leader's caller also listens on <request_id><CALLER_SUFFIX>, so DELETE can end
+# its wait alone while identical requests attached to it keep the generation going
+CALLER_SUFFIX = ":caller"
+CANCELLED_RESULT = {
+    "content": "",
+    "tokens_predicted": 0,
+    "tokens_evaluated": 0,
+    "stop": True,
+    "stop_type": "cancelled"
+}
+
+async def _check_model(model: str):
+    """Reject models no worker pool serves before doing any work for the request"""
+    models = await redis_queue_manager.get_models()
+    if model not in models:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown model '{model}', available: {', '.join(sorted(models)) or 'none'}"
+        )
+
+async def _build_request_data(req: ChatRequest, image_ttl: Optional[int] = None) -> dict:
+    """Normalize the request and move its images to the image store; call after _check_model"""
+    request_data = req.model_dump(exclude={'request_id', 'priority', 'timeout'})
+    try:
+        request_data['messages'] = await image_store.externalize(request_data['messages'], image_ttl)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     request_data['system_prompt'] = req.system_prompt or settings.default_system_prompt
     request_data['temperature'] = req.temperature if req.temperature is not None else settings.default_temperature
     request_data['top_p'] = req.top_p if req.top_p is not None else settings.default_top_p
     request_data['n_predict'] = req.n_predict if req.n_predict is not None else settings.default_n_predict
-    
-    # Enqueue request
-    await redis_queue_manager.enqueue_request(request_data, request_id)
-    max_wait_time = 120
-    poll_interval = 0.1
-    start_time = time.time()
-    
-    while time.time() - start_time < max_wait_time:
-        result = await redis_queue_manager.get_result(request_id)
-        
-        if result:
-            await redis_queue_manager.mark_request_completed(request_id)
-            result["request_id"] = request_id
-            return ChatResponse(**result)
-        
-        await asyncio.sleep(poll_interval)
-
-    await redis_queue_manager.mark_request_completed(request_id)
+    return request_data
+
+def _tenant(x_api_key: Optional[str], authorization: Optional[str]) -> str:
+    api_key = x_api_key
+    if not api_key and authorization and authorization.lower().startswith("bearer "):
+        api_key = authorization[len("bearer "):]
+    return tenant_id(api_key)
+
+def _with_total_time(result: dict, model: str, arrived_at: float) -> dict:
+    """Add the end-to-end time to the result's stage timings and record it"""
+    elapsed = time.time() - arrived_at
+    END_TO_END_SECONDS.labels(model).observe(elapsed)
+    result["timings"] = {**(result.get("timings") or {}), "total_ms": elapsed * 1000}
+    return result
+
+async def _admit(req: ChatRequest, timeout: float):
+    """
+    Admission only needs the model and generation length, so it runs before image download
+    and preprocessing: requests shed under overload never pay for ingest
+    """
+    n_predict = req.n_predict if req.n_predict is not None else settings.default_n_predict
+    retry_after = await admission_controller.try_admit({'model': req.model, 'n_predict': n_predict}, req.priority, timeout)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Server is at capacity, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+async def _wait_while_connected(
+    http_request: Request,
+    request_ids: List[str],
+    timeout: float
+) -> Tuple[Optional[str], Optional[dict]]:
+    """
+    wait_for_result on whichever of request_ids gets a result first, giving up early when
+    the client disconnects. Returns (request_id, result), or (None, None) on timeout or disconnect.
+    """
+    waiters = {
+        asyncio.create_task(result_notifier.wait_for_result(request_id, timeout=timeout)): request_id
+        for request_id in request_ids
+    }
+    try:
+        while True:
+            done, _ = await asyncio.wait(waiters, timeout=DISCONNECT_CHECK_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in done:
+                result = waiter.result()
+                return (waiters[waiter] if result else None), result
+            if await http_request.is_disconnected():
+                return None, None
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+async def _stop_waiting(request_id: str):
+    """
+    Stop the request wherever it is instead of generating for nobody, unless identical
+    requests coalesced with it still wait on the generation
+    """
+    if not await redis_queue_manager.leave_request(request_id):
+        await redis_queue_manager.cancel_request(request_id)
+
+def _raise_failed(result: Optional[dict], request_id: str):
+    if result and result.get("stop_type") == "cancelled":
+        raise HTTPException(status_code=409, detail=f"Request {request_id} was cancelled")
+    if result and result.get("stop_type") == "context_exceeded":
+        raise HTTPException(status_code=400, detail=result["content"])
     raise HTTPException(status_code=408, detail=f"Request timeout for ID: {request_id}")
 
+@router.post("/predict", response_model=ChatResponse)
+async def predict(
+    req: ChatRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None)
+):
+    arrived_at = time.time()
+    request_id = req.request_id or str(uuid.uuid4())
+    timeout = req.timeout or MAX_WAIT_TIME
+    await _check_model(req.model)
+    await _admit(req, timeout)
+    try:
+        return await _predict_admitted(req, http_request, request_id, timeout, _tenant(x_api_key, authorization), arrived_at)
+    finally:
+        admission_controller.release()
+
+async def _predict_admitted(
+    req: ChatRequest,
+    http_request: Request,
+    request_id: str,
+    timeout: float,
+    tenant: str,
+    arrived_at: float
+) -> ChatResponse:
+    """The rest of predict, run while the request holds its admission slot"""
+    request_data = await _build_request_data(req)
+    cache_key = response_cache.cache_key(request_data)
+    cached = await response_cache.get(cache_key)
+    if cached:
+        cached["request_id"] = request_id
+        return ChatResponse(**_with_total_time(cached, req.model, arrived_at), cached=True)
+
+    # Identical deterministic requests already queued or running share one generation
+    if settings.request_coalescing_enabled and is_deterministic(request_data):
+        request_data['coalesce_key'] = canonical_request_hash(request_data)
+        leader_id = await redis_queue_manager.claim_coalesce_key(
+            request_data['coalesce_key'], request_id, MAX_WAIT_TIME
+        )
+        if leader_id:
+            return await _wait_for_coalesced(leader_id, http_request, timeout, req.model, arrived_at)
+
+    waited_on = [request_id]
+    if request_data.get('coalesce_key'):
+        waited_on.append(f"{request_id}{CALLER_SUFFIX}")
+    # Register before enqueueing so a fast result cannot be published before we listen
+    for waiter_id in waited_on:
+        result_notifier.register(waiter_id)
+    try:
+        await redis_queue_manager.enqueue_request(
+            request_data,
+            request_id,
+            priority=req.priority,
+            tenant=tenant,
+            deadline_ms=int((time.time() + timeout) * 1000)
+        )
+        result_id, result = await _wait_while_connected(http_request, waited_on, timeout)
+    finally:
+        for waiter_id in waited_on:
+            result_notifier.unregister(waiter_id)
+
+    if result_id and result_id != request_id:
+        # Cancelled through DELETE while coalesced requests keep the generation going
+        _raise_failed(result, request_id)
+    if result is None:
+        # Timed out or the client left
+        await _stop_waiting(request_id)
+    await redis_queue_manager.mark_request_completed(request_id, req.model)
+    if result and result.get("stop_type") not in FAILED_STOP_TYPES:
+        await response_cache.put(cache_key, result)
+        result["request_id"] = request_id
+        return ChatResponse(**_with_total_time(result, req.model, arrived_at))
+
+    # Identical requests arriving later must not attach to this failed one
+    if request_data.get('coalesce_key'):
+        await redis_queue_manager.release_coalesce_key(request_data['coalesce_key'], request_id)
+    _raise_failed(result, request_id)
+
+async def _wait_for_coalesced(
+    leader_id: str,
+    http_request: Request,
+    timeout: float,
+    model: str,
+    arrived_at: float
+) -> ChatResponse:
+    """Attach to the request that is already generating this exact response"""
+    result_notifier.register(leader_id)
+    try:
+        # The leader may have finished between claiming the key and us registering
+        result = await redis_queue_manager.get_result(leader_id)
+        if not result:
+            _, result = await _wait_while_connected(http_request, [leader_id], timeout)
+    finally:
+        result_notifier.unregister(leader_id)
+
+    if result and result.get("stop_type") not in FAILED_STOP_TYPES:
+        result["request_id"] = leader_id
+        return ChatResponse(**_with_total_time(result, model, arrived_at))
+    if result is None:
+        await _stop_waiting(leader_id)
+    _raise_failed(result, leader_id)
+
+async def _cached_event_stream(response: ChatResponse):
+    yield f"data: {json.dumps({'content': response.content, 'stop': False, 'request_id': response.request_id})}\n\n"
+    yield f"data: {response.model_dump_json()}\n\n"
+    yield "data: [DONE]\n\n"
+
+@router.post("/predict/stream")
+async def predict_stream(
+    req: ChatRequest,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Server-sent events: one `data:` event per generated chunk, then the final
+    ChatResponse-shaped summary and `data: [DONE]`.
+    """
+    arrived_at = time.time()
+    request_id = req.request_id or str(uuid.uuid4())
+    timeout = req.timeout or MAX_WAIT_TIME
+    await _check_model(req.model)
+    await _admit(req, timeout)
+
+    deadline = time.time() + timeout
+    try:
+        request_data = await _build_request_data(req)
+        cache_key = response_cache.cache_key(request_data)
+        cached = await response_cache.get(cache_key)
+        if not cached:
+            request_data['stream'] = True
+            await redis_queue_manager.enqueue_request(
+                request_data,
+                request_id,
+                priority=req.priority,
+                tenant=_tenant(x_api_key, authorization),
+                deadline_ms=int(deadline * 1000)
+            )
+    except Exception:
+        admission_controller.release()
+        raise
+
+    if cached:
+        admission_controller.release()
+        cached["request_id"] = request_id
+        return StreamingResponse(
+            _cached_event_stream(ChatResponse(**_with_total_time(cached, req.model, arrived_at), cached=True)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Request-ID": request_id}
+        )
+
+    async def event_stream():
+        last_id = "0"
+        finished = False
+        try:
+            while time.time() < deadline + STREAM_DEADLINE_GRACE:
+                for entry_id, chunk in await redis_queue_manager.read_stream_chunks(request_id, last_id):
+                    last_id = entry_id
+                    if chunk.pop("final", False):
+                        await response_cache.put(cache_key, chunk)
+                        chunk["request_id"] = request_id
+                        yield f"data: {ChatResponse(**_with_total_time(chunk, req.model, arrived_at)).model_dump_json()}\n\n"
+                        yield "data: [DONE]\n\n"
+                        finished = True
+                        return
+                    chunk["request_id"] = request_id
+                    yield f"data: {json.dumps(chunk)}\n\n"
+
+            yield f"data: {json.dumps({'error': 'timeout', 'request_id': request_id})}\n\n"
+        finally:
+            # Runs on completion, timeout and client disconnect alike
+            admission_controller.release()
+            if not finished:
+                await asyncio.shield(redis_queue_manager.cancel_request(request_id))
+            await asyncio.shield(redis_queue_manager.delete_stream(request_id))
+            await asyncio.shield(redis_queue_manager.mark_request_completed(request_id, req.model))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Request-ID": request_id}
+    )
+
+@router.post("/predict/batch", response_model=BatchJob)
+async def predict_batch(
+    batch: BatchPredictRequest,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Enqueue many requests in one pipeline and return a job handle at once. Results are
+    collected from GET /v1/jobs/{job_id}, so bulk work holds no connection, waiter or
+    admission slot while it is queued.
+    """
+    if len(batch.requests) > settings.batch_max_requests:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {settings.batch_max_requests} requests")
+
+    job_id = str(uuid.uuid4())
+    timeout = batch.timeout or settings.batch_job_timeout
+    # Images must stay stored for as long as the job's requests may wait to be scheduled
+    image_ttl = int(timeout) + settings.image_store_ttl
+    request_ids = [req.request_id or str(uuid.uuid4()) for req in batch.requests]
+    seen = set()
+    for request_id in request_ids:
+        if request_id in seen:
+            raise HTTPException(status_code=400, detail=f"Duplicate request_id {request_id} in batch")
+        seen.add(request_id)
+
+    for model in {req.model for req in batch.requests}:
+        await _check_model(model)
+
+    # Ingest (image downloads, preprocessing, image store writes) runs for several requests at once
+    ingest_slots = asyncio.Semaphore(settings.image_download_concurrency)
+
+    async def build(req: ChatRequest) -> dict:
+        async with ingest_slots:
+            return await _build_request_data(req, image_ttl)
+
+    builds = [asyncio.create_task(build(req)) for req in batch.requests]
+    try:
+        built = await asyncio.gather(*builds)
+    except Exception:
+        # One invalid request fails the whole job; stop ingesting the others
+        for task in builds:
+            task.cancel()
+        raise
+
+    requests, priorities = {}, {}
+    for request_id, req, request_data in zip(request_ids, batch.requests, built):
+        request_data['job_id'] = job_id
+        requests[request_id] = request_data
+        priorities[request_id] = req.priority
+
+    await redis_queue_manager.enqueue_job(
+        job_id,
+        requests,
+        priorities,
+        tenant=_tenant(x_api_key, authorization),
+        deadline_ms=int((time.time() + timeout) * 1000)
+    )
+    return BatchJob(job_id=job_id, request_ids=list(requests))
+
+@router.get("/jobs/{job_id}", response_model=JobResults)
+async def get_job(
+    job_id: str,
+    cursor: int = Query(0, ge=0, description="Number of results already received"),
+    wait: float = Query(0, ge=0, le=JOB_MAX_WAIT, description="Seconds to long-poll when nothing new has finished")
+):
+    """Results finished since cursor; with wait, blocks until at least one more finishes"""
+    if wait:
+        # Register before reading so a completion in between still wakes us
+        result_notifier.register(job_id)
+    try:
+        job = await redis_queue_manager.get_job(job_id, cursor)
+        if job and wait and not job["results"] and job["completed"] < job["total"]:
+            await result_notifier.wait_for_result(job_id, timeout=wait)
+            job = await redis_queue_manager.get_job(job_id, cursor)
+    finally:
+        if wait:
+            result_notifier.unregister(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResults(
+        job_id=job_id,
+        total=job["total"],
+        completed=job["completed"],
+        done=job["completed"] >= job["total"],
+        cursor=max(cursor, job["completed"]),
+        results=[ChatResponse(**result) for result in job["results"]]
+    )
+
 @router.get("/queue/stats")
 async def get_queue_stats():
-    return await redis_queue_manager.get_queue_stats()
+    per_model = await redis_queue_manager.get_model_queue_stats()
+    dispatch_stats = queue_processor.get_dispatch_stats()
+    return {
+        **redis_queue_manager.total_stats(per_model),
+        "models": {model: {**stats, **dispatch_stats.get(model, {})} for model, stats in per_model.items()},
+        **response_cache.get_stats(),
+        **admission_controller.get_stats()
+    }
+
+@router.delete("/requests/{request_id}")
+async def cancel_request(request_id: str):
+    """
+    Cancel a queued or running request: it is skipped at dequeue, or its worker call is
+    aborted. The caller waiting on it gets 409, or the stream ends with a cancelled summary.
+    """
+    if not await redis_queue_manager.request_exists(request_id):
+        raise HTTPException(status_code=404, detail=f"Request {request_id} not found")
+    if await redis_queue_manager.get_result(request_id):
+        raise HTTPException(status_code=409, detail=f"Request {request_id} already completed")
+    if await redis_queue_manager.leave_request(request_id):
+        # Identical requests coalesced with it still wait on the generation: only end the wait of its own caller
+        await redis_queue_manager.store_result(f"{request_id}{CALLER_SUFFIX}", CANCELLED_RESULT)
+        return {"request_id": request_id, "status": "cancelled"}
+    await redis_queue_manager.cancel_request(request_id)
+    # Answer whoever waits on it, as a result or a final stream chunk, rather than when the dispatcher gets to it
+    await redis_queue_manager.store_result(request_id, CANCELLED_RESULT)
+    await redis_queue_manager.append_stream_chunk(request_id, {**CANCELLED_RESULT, "final": True})
+    return {"request_id": request_id, "status": "cancelled"}
 
 @router.get("/result/{request_id}")
 async def get_result(request_id: str):
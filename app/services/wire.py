@@ -0,0 +1,38 @@
+from typing import Any, Union
+
+import orjson
+
+from app.config import settings
+
+# Queue payloads, results and stream chunks are stored as a version byte followed by the
+# body. Version 1 is compact UTF-8 JSON written by orjson. Legacy items are plain JSON text,
+# whose first byte is never a control character, so both can be read side by side.
+WIRE_VERSION = 1
+_VERSION_PREFIX = bytes([WIRE_VERSION])
+
+# Lua counterpart of decode_payload() for the queue scripts
+DECODE_PAYLOAD_LUA = """
+local function decode_payload(item)
+    if string.byte(item, 1) == 1 then
+        return cjson.decode(string.sub(item, 2))
+    end
+    return cjson.decode(item)
+end
+"""
+
+def encode_payload(obj: Any) -> bytes:
+    """
+    Encode for Redis. With settings.wire_format_version 0 the output is plain JSON, which
+    API processes from before the versioned format can still read.
+    """
+    if settings.wire_format_version < WIRE_VERSION:
+        return orjson.dumps(obj)
+    return _VERSION_PREFIX + orjson.dumps(obj)
+
+def decode_payload(data: Union[bytes, str]) -> Any:
+    """Decode a versioned or legacy payload"""
+    if isinstance(data, str):
+        data = data.encode()
+    if data[:1] == _VERSION_PREFIX:
+        return orjson.loads(memoryview(data)[1:])
+    return orjson.loads(data)
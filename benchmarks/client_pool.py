@@ -0,0 +1,73 @@
+"""
+Compare a fresh httpx client per completion against QueueProcessor's pooled keep-alive
+client, using the fake llama-server. Requires a running redis-server:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.client_pool --requests 500
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.services.batch_manager import QueueProcessor
+from app.services.redis_pool import redis_queue_manager, get_redis_pool
+from benchmarks.fake_llama_server import create_app, running_server
+
+MODEL = "benchmark"
+REQUEST_DATA = {
+    "model": MODEL,
+    "messages": [{"role": "user", "content": "Describe the weather"}],
+    "temperature": 0.0,
+    "top_p": 0.9,
+    "n_predict": 4,
+}
+
+async def run(label: str, app, total: int, concurrency: int, send) -> None:
+    app.state.connections.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await send()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    elapsed = time.perf_counter() - start
+    print(f"{label:>10}: {total / elapsed:8.1f} req/s, {elapsed * 1000 / total:.2f} ms/request, "
+          f"{len(app.state.connections)} TCP connections")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=18001)
+    args = parser.parse_args()
+
+    worker_url = f"http://127.0.0.1:{args.port}"
+    app = create_app(slots=args.concurrency, prefill_ms=0, decode_ms=0)
+
+    redis = get_redis_pool()
+    slots_key = redis_queue_manager.model_worker_keys(MODEL)[1]
+    await redis.hset(slots_key, worker_url, args.concurrency)
+    processor = QueueProcessor()
+
+    async def per_request_client():
+        payload = await processor._build_payload(REQUEST_DATA)
+        async with httpx.AsyncClient(timeout=120) as client:
+            response = await client.post(f"{worker_url}/completion", json=payload)
+            response.raise_for_status()
+
+    async def pooled_client():
+        await processor._send_to_worker(worker_url, REQUEST_DATA)
+
+    async with running_server(app, port=args.port):
+        try:
+            await run("per-request", app, args.requests, args.concurrency, per_request_client)
+            await run("pooled", app, args.requests, args.concurrency, pooled_client)
+        finally:
+            await processor.stop()
+            await redis.hdel(slots_key, worker_url)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+"""
+Minimal stand-in for llama-server's /completion and /health endpoints, for benchmarking
+the dispatch path without a GPU.
+
+    python -m benchmarks.fake_llama_server --port 8001 --slots 8 --prefill-ms 20 --decode-ms 5 --image-prefill-ms 50
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import aclosing, asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+class ConnectionTracker:
+    """
+    Records each distinct client (host, port) pair, i.e. each TCP connection. Plain ASGI
+    rather than @app.middleware("http"), which would hide client disconnects from the endpoint.
+    """
+    def __init__(self, app, connections: set):
+        self.app = app
+        self.connections = connections
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.connections.add(tuple(scope["client"] or ()))
+        await self.app(scope, receive, send)
+
+def create_app(slots: int = 8, prefill_ms: float = 20, decode_ms: float = 5, image_prefill_ms: float = 0) -> FastAPI:
+    """
+    slots mirrors --parallel: requests beyond it wait for a free slot.
+    prefill_ms is charged once per request plus image_prefill_ms per attached image,
+    decode_ms per generated token.
+    """
+    app = FastAPI()
+    app.state.slot_semaphore = asyncio.Semaphore(slots)
+    app.state.connections = set()
+    app.state.requests = 0
+
+    app.add_middleware(ConnectionTracker, connections=app.state.connections)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/completion")
+    async def completion(request: Request):
+        body = await request.json()
+        n_predict = body.get("n_predict", 128)
+        n_prompt = len(body.get("prompt", "").split())
+        n_images = len(body.get("image_data", []))
+        app.state.requests += 1
+
+        async def generate():
+            async with app.state.slot_semaphore:
+                start = time.perf_counter()
+                await asyncio.sleep((prefill_ms + n_images * image_prefill_ms) / 1000)
+                prompt_ms = (time.perf_counter() - start) * 1000
+                for i in range(n_predict):
+                    await asyncio.sleep(decode_ms / 1000)
+                    yield {"content": f" tok{i}", "stop": False}
+                predicted_ms = (time.perf_counter() - start) * 1000 - prompt_ms
+                yield {
+                    "content": "",
+                    "stop": True,
+                    "stop_type": "limit",
+                    "tokens_predicted": n_predict,
+                    "tokens_evaluated": n_prompt,
+                    "timings": {
+                        "prompt_n": n_prompt,
+                        "prompt_ms": prompt_ms,
+                        "prompt_per_second": n_prompt * 1000 / prompt_ms,
+                        "predicted_n": n_predict,
+                        "predicted_ms": predicted_ms,
+                        "predicted_per_second": n_predict * 1000 / predicted_ms if predicted_ms else 0,
+                    },
+                }
+
+        if body.get("stream"):
+            async def event_stream():
+                async for chunk in generate():
+                    yield f"data: {json.dumps(chunk)}\n\n"
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        content = []
+        async with aclosing(generate()) as chunks:
+            async for chunk in chunks:
+                # Like llama-server, stop generating and free the slot once the client is gone
+                if await request.is_disconnected():
+                    return JSONResponse({"error": "client disconnected"}, status_code=499)
+                content.append(chunk["content"])
+        chunk["content"] = "".join(content)
+        return JSONResponse(chunk)
+
+    return app
+
+@asynccontextmanager
+async def running_server(app: FastAPI, host: str = "127.0.0.1", port: int = 8001):
+    """Serve the app in the current event loop for the duration of the block"""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield server
+    finally:
+        server.should_exit = True
+        await task
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--prefill-ms", type=float, default=20)
+    parser.add_argument("--decode-ms", type=float, default=5)
+    parser.add_argument("--image-prefill-ms", type=float, default=0)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.slots, args.prefill_ms, args.decode_ms, args.image_prefill_ms),
+        host=args.host,
+        port=args.port,
+        log_level=args.log_level
+    )
+
+if __name__ == "__main__":
+    main()
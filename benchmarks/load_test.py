@@ -0,0 +1,300 @@
+"""
+End-to-end load test of the API and dispatch path against fake llama-servers, no GPU needed.
+
+Starts the fake workers and the API as subprocesses, registers the workers in Redis the way
+workers/worker.py does, then drives open-loop (Poisson) traffic at each rate: a mix of text
+and image requests, optionally some over the SSE endpoint. Reports throughput, latency
+percentiles, queue depth over time and Redis ops per request. Requires a running redis-server:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.load_test --rates 5,20,40 --duration 30
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import httpx
+from PIL import Image
+
+from app.config import settings
+from app.services.redis_pool import redis_queue_manager, get_redis_pool
+
+PROMPTS = [
+    "Describe the scene in one sentence",
+    "What is the main object here?",
+    "Summarize the following in three words",
+    "Translate to French: good morning",
+    "List two colours you can see",
+]
+SPARKLINE = " ▁▂▃▄▅▆▇█"
+
+def make_images(count: int) -> List[str]:
+    """Distinct camera-sized JPEGs as data URIs, so preprocessing does real work"""
+    images = []
+    for i in range(count):
+        image = Image.new("RGB", (1600, 1200), (40 * i % 256, 90, 160))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}")
+    return images
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def sparkline(values: List[float]) -> str:
+    peak = max(values, default=0) or 1
+    return "".join(SPARKLINE[round(value / peak * (len(SPARKLINE) - 1))] for value in values)
+
+class LoadGenerator:
+    def __init__(self, api_url: str, args: argparse.Namespace):
+        self.api_url = api_url
+        self.args = args
+        self.images = make_images(args.distinct_images)
+
+    def build_request(self) -> dict:
+        kind = "image" if random.random() < self.args.image_ratio else "text"
+        # A random suffix keeps the response cache and request coalescing out of the picture
+        text = f"{random.choice(PROMPTS)} ({uuid.uuid4().hex[:8]})"
+        if kind == "image":
+            content = [
+                {"type": "text", "text": text},
+                {"type": "image_url", "image_url": {"url": random.choice(self.images)}}
+            ]
+        else:
+            content = text
+        return {
+            "model": self.args.model,
+            "messages": [{"role": "user", "content": content}],
+            "n_predict": self.args.n_predict,
+            "temperature": 0.7,
+        }
+
+    async def send(self, client: httpx.AsyncClient, records: List[dict]):
+        body = self.build_request()
+        stream = random.random() < self.args.stream_ratio
+        record = {
+            "kind": "image" if isinstance(body["messages"][0]["content"], list) else "text",
+            "stream": stream,
+            "status": None,
+            "latency_ms": None,
+            "ttft_ms": None,
+        }
+        start = time.perf_counter()
+        try:
+            if stream:
+                async with client.stream("POST", "/v1/predict/stream", json=body) as response:
+                    record["status"] = response.status_code
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: ") and record["ttft_ms"] is None:
+                            record["ttft_ms"] = (time.perf_counter() - start) * 1000
+                        if line == "data: [DONE]":
+                            break
+            else:
+                response = await client.post("/v1/predict", json=body)
+                record["status"] = response.status_code
+        except httpx.HTTPError as e:
+            record["status"] = type(e).__name__
+        record["latency_ms"] = (time.perf_counter() - start) * 1000
+        records.append(record)
+
+    async def run_rate(self, rate: float) -> Dict:
+        redis = get_redis_pool()
+        records: List[dict] = []
+        samples: List[dict] = []
+        stop_sampling = asyncio.Event()
+
+        async def sample_queue():
+            start = time.perf_counter()
+            while not stop_sampling.is_set():
+                stats = await redis_queue_manager.get_queue_stats(self.args.model)
+                samples.append({
+                    "t": time.perf_counter() - start,
+                    "pending": stats["pending_requests"],
+                    "processing": stats["processing_requests"],
+                    "busy_slots": stats["busy_slots"],
+                })
+                await asyncio.sleep(self.args.sample_interval)
+
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+        async with httpx.AsyncClient(base_url=self.api_url, timeout=180, limits=limits) as client:
+            ops_before = (await redis.info("stats"))["total_commands_processed"]
+            sampler = asyncio.create_task(sample_queue())
+
+            start = time.perf_counter()
+            tasks = []
+            while time.perf_counter() - start < self.args.duration:
+                tasks.append(asyncio.create_task(self.send(client, records)))
+                await asyncio.sleep(random.expovariate(rate))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+
+            stop_sampling.set()
+            await sampler
+            ops_after = (await redis.info("stats"))["total_commands_processed"]
+
+        ok = [r for r in records if r["status"] == 200]
+        # The sampler's own stats script calls are excluded from the per-request figure
+        ops = ops_after - ops_before - len(samples)
+        return {
+            "rate": rate,
+            "sent": len(records),
+            "ok": len(ok),
+            "status_counts": {str(status): sum(1 for r in records if r["status"] == status)
+                              for status in {r["status"] for r in records}},
+            "throughput": len(ok) / elapsed,
+            "latency_ms": {
+                kind: {pct: percentile([r["latency_ms"] for r in ok if kind in ("all", r["kind"])], pct)
+                       for pct in (50, 95, 99)}
+                for kind in ("all", "text", "image")
+            },
+            "ttft_ms": {pct: percentile([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None], pct)
+                        for pct in (50, 95, 99)},
+            "redis_ops_per_request": ops / max(len(records), 1),
+            "queue_depth": samples,
+        }
+
+def print_report(result: Dict):
+    print(f"\n== {result['rate']:.1f} req/s offered ==")
+    print(f"sent {result['sent']}, ok {result['ok']}, statuses {result['status_counts']}, "
+          f"throughput {result['throughput']:.1f} req/s")
+    for kind, pcts in result["latency_ms"].items():
+        print(f"  latency {kind:>5}: p50 {pcts[50]:8.1f} ms  p95 {pcts[95]:8.1f} ms  p99 {pcts[99]:8.1f} ms")
+    ttft = result["ttft_ms"]
+    if ttft[50]:
+        print(f"  stream  ttft: p50 {ttft[50]:8.1f} ms  p95 {ttft[95]:8.1f} ms  p99 {ttft[99]:8.1f} ms")
+    print(f"  redis ops/request: {result['redis_ops_per_request']:.1f}")
+    pending = [sample["pending"] for sample in result["queue_depth"]]
+    processing = [sample["processing"] for sample in result["queue_depth"]]
+    if pending:
+        print(f"  queued     max {max(pending):4d} mean {statistics.mean(pending):6.1f} |{sparkline(pending)}|")
+        print(f"  in flight  max {max(processing):4d} mean {statistics.mean(processing):6.1f} |{sparkline(processing)}|")
+
+async def wait_until_ready(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout} s")
+
+async def send_heartbeats(worker_urls: List[str], args: argparse.Namespace):
+    """Stand-in for the heartbeat thread in workers/worker.py"""
+    redis = get_redis_pool()
+    while True:
+        for worker_url in worker_urls:
+            await redis.set(
+                f"{redis_queue_manager.worker_heartbeat_prefix}{worker_url}",
+                json.dumps({"model": args.model, "slots": args.slots, "context": args.context}),
+                ex=15
+            )
+        await asyncio.sleep(5)
+
+@asynccontextmanager
+async def fake_cluster(args: argparse.Namespace):
+    """Fake workers plus one API process; yields the API base URL"""
+    redis = get_redis_pool()
+    processes: List[asyncio.subprocess.Process] = []
+    heartbeat = None
+    worker_urls = [f"http://127.0.0.1:{args.worker_base_port + i}" for i in range(args.workers)]
+    env = {**os.environ, "REDIS_URL": settings.redis_url}
+    load_key, slots_key, context_key = redis_queue_manager.model_worker_keys(args.model)
+    try:
+        for worker_url in worker_urls:
+            processes.append(await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "benchmarks.fake_llama_server",
+                "--host", "127.0.0.1", "--port", worker_url.rsplit(":", 1)[1],
+                "--slots", str(args.slots), "--prefill-ms", str(args.prefill_ms),
+                "--decode-ms", str(args.decode_ms), "--image-prefill-ms", str(args.image_prefill_ms),
+                env=env
+            ))
+            await wait_until_ready(f"{worker_url}/health")
+            await redis.hset(slots_key, worker_url, args.slots)
+            await redis.hset(context_key, worker_url, args.context)
+            await redis.zadd(load_key, {worker_url: 0})
+            await redis.sadd(redis_queue_manager.worker_models_key, args.model)
+        heartbeat = asyncio.create_task(send_heartbeats(worker_urls, args))
+
+        api_url = f"http://127.0.0.1:{args.api_port}"
+        processes.append(await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(args.api_port), "--log-level", "warning",
+            env=env
+        ))
+        await wait_until_ready(f"{api_url}/health")
+        yield api_url
+    finally:
+        if heartbeat:
+            heartbeat.cancel()
+        for process in processes:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+        for worker_url in worker_urls:
+            await redis.zrem(load_key, worker_url)
+            await redis.hdel(slots_key, worker_url)
+            await redis.hdel(context_key, worker_url)
+            await redis.delete(f"{redis_queue_manager.worker_heartbeat_prefix}{worker_url}")
+        await redis.srem(redis_queue_manager.worker_models_key, args.model)
+
+async def wait_for_drain(model: str, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        stats = await redis_queue_manager.get_queue_stats(model)
+        if not stats["pending_requests"] and not stats["processing_requests"]:
+            return
+        await asyncio.sleep(0.5)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="5,20", help="Comma-separated offered loads in requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of traffic per rate")
+    parser.add_argument("--model", default="fake-vlm")
+    parser.add_argument("--n-predict", type=int, default=32)
+    parser.add_argument("--image-ratio", type=float, default=0.3)
+    parser.add_argument("--stream-ratio", type=float, default=0.1)
+    parser.add_argument("--distinct-images", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--context", type=int, default=8192)
+    parser.add_argument("--prefill-ms", type=float, default=30)
+    parser.add_argument("--decode-ms", type=float, default=10)
+    parser.add_argument("--image-prefill-ms", type=float, default=60)
+    parser.add_argument("--api-port", type=int, default=18000)
+    parser.add_argument("--worker-base-port", type=int, default=18100)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--json", help="Write the full results, including the queue depth series, to this file")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = []
+    async with fake_cluster(args) as api_url:
+        generator = LoadGenerator(api_url, args)
+        for rate in (float(rate) for rate in args.rates.split(",")):
+            result = await generator.run_rate(rate)
+            print_report(result)
+            results.append(result)
+            await wait_for_drain(args.model)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Round trips and wall time per queue operation: one claim per request and separate
+stats reads (before) against the batched claim script and single stats script (after).
+Requires a running redis-server:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.redis_round_trips --batches 200 --batch-size 8
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+
+from redis.asyncio.client import Pipeline, Redis
+
+from app.services.redis_pool import MAX_RETRIES, PRIORITIES, VISIBILITY_TIMEOUT_MS, redis_queue_manager, get_redis_pool
+from app.services.wire import decode_payload
+
+MODEL = "benchmark"
+REQUEST_DATA = {
+    "model": MODEL,
+    "messages": [{"role": "user", "content": "Describe the weather"}],
+    "temperature": 0.0,
+    "top_p": 0.9,
+    "n_predict": 64,
+}
+
+class RoundTripCounter:
+    """Counts client round trips: each command outside a pipeline, and each pipeline execute"""
+    def __init__(self):
+        self.count = 0
+
+    @contextmanager
+    def installed(self):
+        execute_command = Redis.execute_command
+        pipeline_execute = Pipeline.execute
+
+        async def counted_command(client, *args, **kwargs):
+            self.count += 1
+            return await execute_command(client, *args, **kwargs)
+
+        async def counted_execute(pipe, *args, **kwargs):
+            self.count += 1
+            return await pipeline_execute(pipe, *args, **kwargs)
+
+        Redis.execute_command = counted_command
+        Pipeline.execute = counted_execute
+        try:
+            yield self
+        finally:
+            Redis.execute_command = execute_command
+            Pipeline.execute = pipeline_execute
+
+async def per_request_dequeue(batch_size: int):
+    """The previous dequeue: one claim script call, and one result write per expired request"""
+    batch = []
+    while len(batch) < batch_size:
+        claimed, expired, *_ = await redis_queue_manager._claim_batch(
+            keys=[
+                redis_queue_manager.inflight_requests, redis_queue_manager.model_dispatch_stream(MODEL),
+                redis_queue_manager.queued_requests
+            ],
+            args=[
+                redis_queue_manager.model_queue_prefix(MODEL), redis_queue_manager.dispatch_group,
+                redis_queue_manager.consumer_name, int(time.time() * 1000), VISIBILITY_TIMEOUT_MS,
+                MAX_RETRIES + 1, redis_queue_manager._tenant_weights, 1, -1,
+                redis_queue_manager.cancel_prefix, -1, -1, *PRIORITIES
+            ]
+        )
+        for item in expired:
+            await redis_queue_manager.store_result(decode_payload(item)["id"], {"stop_type": "deadline_exceeded"})
+        if not claimed and not expired:
+            break
+        batch.extend(decode_payload(item) for item in claimed)
+    return batch
+
+async def scripted_dequeue(batch_size: int):
+    return await redis_queue_manager.dequeue_batch_with_timeout(MODEL, batch_size=batch_size, timeout_ms=0)
+
+async def separate_stats():
+    """The previous stats read: pending hash, in-flight count and worker stats as separate calls"""
+    redis = redis_queue_manager.redis
+    await redis.hgetall(f"{redis_queue_manager.model_queue_prefix(MODEL)}:pending")
+    await redis.xlen(redis_queue_manager.model_dispatch_stream(MODEL))
+    await redis_queue_manager.get_worker_stats(MODEL)
+
+async def scripted_stats():
+    await redis_queue_manager.get_queue_stats(MODEL)
+
+async def measure(label: str, operation, batches: int, batch_size: int, expired_per_batch: int) -> None:
+    counter = RoundTripCounter()
+    trips, times = [], []
+
+    for _ in range(batches):
+        now_ms = int(time.time() * 1000)
+        for i in range(batch_size + expired_per_batch):
+            deadline_ms = now_ms - 1000 if i < expired_per_batch else None
+            await redis_queue_manager.enqueue_request(REQUEST_DATA, str(uuid.uuid4()), deadline_ms=deadline_ms)
+
+        with counter.installed():
+            counter.count = 0
+            start = time.perf_counter()
+            batch = await operation()
+            times.append((time.perf_counter() - start) * 1000)
+            trips.append(counter.count)
+
+        for request in batch or []:
+            await redis_queue_manager.mark_request_completed(request["id"], MODEL)
+
+    print(f"{label:>28}: {statistics.mean(trips):5.1f} round trips, "
+          f"p50 {statistics.median(times):.2f} ms, mean {statistics.mean(times):.2f} ms")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--expired", type=int, default=2, help="Requests per batch that are already past their deadline")
+    args = parser.parse_args()
+
+    redis = get_redis_pool()
+    await redis.delete(redis_queue_manager.inflight_requests, redis_queue_manager.model_dispatch_stream(MODEL))
+
+    await measure("dequeue, claim per request", lambda: per_request_dequeue(args.batch_size),
+                  args.batches, args.batch_size, args.expired)
+    await measure("dequeue, batched claim", lambda: scripted_dequeue(args.batch_size),
+                  args.batches, args.batch_size, args.expired)
+    await measure("queue stats, separate reads", separate_stats, args.batches, 0, 0)
+    await measure("queue stats, single script", scripted_stats, args.batches, 0, 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
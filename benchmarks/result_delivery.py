@@ -0,0 +1,106 @@
+"""
+Compare result delivery by 100 ms polling against pub/sub notification.
+
+Requires a running redis-server:
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.result_delivery --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from app.services.redis_pool import redis_queue_manager, get_redis_pool
+from app.services.result_notifier import result_notifier
+
+POLL_INTERVAL = 0.1
+MODEL = "benchmark"
+
+async def fake_dispatcher(service_ms: float):
+    """Drain the request queue and store a result after a simulated generation time"""
+    async def complete(request):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * service_ms / 1000)
+        await redis_queue_manager.store_result(request["id"], {
+            "content": "ok",
+            "tokens_predicted": 1,
+            "tokens_evaluated": 1,
+            "stop": True,
+            "stop_type": "eos"
+        })
+
+    while True:
+        batch = await redis_queue_manager.dequeue_batch_with_timeout(MODEL, batch_size=8, timeout_ms=10)
+        for request in batch:
+            asyncio.create_task(complete(request))
+
+async def poll_request(request_id: str):
+    while True:
+        result = await redis_queue_manager.get_result(request_id)
+        if result:
+            return result
+        await asyncio.sleep(POLL_INTERVAL)
+
+async def notify_request(request_id: str):
+    return await result_notifier.wait_for_result(request_id, timeout=120)
+
+async def run_mode(mode: str, total: int, concurrency: int, service_ms: float) -> dict:
+    redis = get_redis_pool()
+    await redis.delete(redis_queue_manager.inflight_requests, redis_queue_manager.model_dispatch_stream(MODEL))
+
+    dispatcher = asyncio.create_task(fake_dispatcher(service_ms))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            request_id = str(uuid.uuid4())
+            start = time.perf_counter()
+            if mode == "notify":
+                result_notifier.register(request_id)
+            try:
+                await redis_queue_manager.enqueue_request({"model": MODEL, "messages": []}, request_id)
+                if mode == "notify":
+                    await notify_request(request_id)
+                else:
+                    await poll_request(request_id)
+            finally:
+                result_notifier.unregister(request_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    ops_before = (await redis.info("stats"))["total_commands_processed"]
+    await asyncio.gather(*[one() for _ in range(total)])
+    ops_after = (await redis.info("stats"))["total_commands_processed"]
+
+    dispatcher.cancel()
+    try:
+        await dispatcher
+    except asyncio.CancelledError:
+        pass
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "ops_per_request": (ops_after - ops_before) / total,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--service-ms", type=float, default=200, help="Mean simulated generation time")
+    args = parser.parse_args()
+
+    await result_notifier.start()
+    try:
+        for mode in ("poll", "notify"):
+            stats = await run_mode(mode, args.requests, args.concurrency, args.service_ms)
+            print(f"{stats['mode']:>6}: {stats['ops_per_request']:.1f} redis ops/request, "
+                  f"p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+    finally:
+        await result_notifier.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
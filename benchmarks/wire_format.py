@@ -0,0 +1,128 @@
+"""
+Encode/decode cost and Redis memory per queued request: the previous stdlib JSON payloads,
+read through the decoding connection, against the versioned wire format (app/services/wire.py)
+read as bytes. Covers a text-only and an image-heavy request as queued (images are
+externalized to vlm-image: references at ingest) and a finished result. The memory part
+enqueues into a scratch model queue and requires a running redis-server:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.wire_format --iterations 20000 --queued 2000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Callable, Dict
+
+from app.services.redis_pool import redis_queue_manager, get_redis_pool
+from app.services.wire import decode_payload, encode_payload
+
+MODEL = "benchmark-wire"
+SYSTEM_PROMPT = "You are a careful assistant that describes images and answers questions about them concisely."
+
+def text_request() -> Dict:
+    turns = [
+        "Summarize the release notes below in three bullet points.",
+        "The new version adds per-model worker pools, request cancellation and bulk submission.",
+        "Which of these changes matters most for latency?",
+    ]
+    return {
+        "model": MODEL,
+        "messages": [{"role": "system", "content": SYSTEM_PROMPT}] + [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": turn} for i, turn in enumerate(turns)
+        ],
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "n_predict": 128,
+    }
+
+def image_request(images: int = 4) -> Dict:
+    content = [{"type": "text", "text": "Compare these photos and list what changed between them."}]
+    content += [
+        {"type": "image_url", "image_url": {"url": f"vlm-image:{hashlib.sha256(str(i).encode()).hexdigest()}"}}
+        for i in range(images)
+    ]
+    return {
+        "model": MODEL,
+        "messages": [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": content}],
+        "temperature": 0.2,
+        "top_p": 0.9,
+        "n_predict": 256,
+    }
+
+def result_payload() -> Dict:
+    return {
+        "content": "The second photo shows the same street after rain: the road is darker, " * 6,
+        "tokens_predicted": 128,
+        "tokens_evaluated": 412,
+        "stop": True,
+        "stop_type": "limit",
+        "worker": "http://10.0.0.12:8001",
+    }
+
+def legacy_decode(data: bytes):
+    """What the decoding connection plus json.loads did: UTF-8 decode, then parse"""
+    return json.loads(data.decode())
+
+def time_per_call(function: Callable, argument, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(argument)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def measure_codec(label: str, payload: Dict, iterations: int):
+    legacy = json.dumps(payload).encode()
+    versioned = encode_payload(payload)
+    print(f"{label:>14}: json {len(legacy):5d} B, encode {time_per_call(json.dumps, payload, iterations):6.2f} us, "
+          f"decode {time_per_call(legacy_decode, legacy, iterations):6.2f} us | "
+          f"wire {len(versioned):5d} B, encode {time_per_call(encode_payload, payload, iterations):6.2f} us, "
+          f"decode {time_per_call(decode_payload, versioned, iterations):6.2f} us")
+
+async def memory_per_request(request_data: Dict, encode: Callable, queued: int) -> float:
+    """MEMORY USAGE of a tenant queue holding `queued` copies of the request, per request"""
+    redis = get_redis_pool()
+    prefix = redis_queue_manager.model_queue_prefix(MODEL)
+    queue_key = f"{prefix}:normal:memory-{uuid.uuid4().hex[:8]}"
+    tenant = queue_key.rsplit(":", 1)[1]
+    request_ids = [str(uuid.uuid4()) for _ in range(queued)]
+    async with redis_queue_manager.binary_redis.pipeline(transaction=False) as pipe:
+        for request_id in request_ids:
+            payload = redis_queue_manager._queue_payload(request_data, request_id, "normal", tenant, None)
+            await redis_queue_manager._enqueue_request(
+                keys=[redis_queue_manager.queued_requests], args=[prefix, encode(payload)], client=pipe
+            )
+        await pipe.execute()
+    used = await redis.memory_usage(queue_key, samples=0)
+    await redis.delete(*await redis.keys(f"{prefix}:*"))
+    await redis.hdel(redis_queue_manager.queued_requests, *request_ids)
+    return used / queued
+
+async def measure_memory(queued: int):
+    for label, request_data in (("text-only", text_request()), ("image-heavy", image_request())):
+        legacy = await memory_per_request(request_data, json.dumps, queued)
+        versioned = await memory_per_request(request_data, encode_payload, queued)
+        print(f"{label:>14}: json {legacy:7.1f} B/request, wire {versioned:7.1f} B/request "
+              f"({(1 - versioned / legacy) * 100:.1f}% less)")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="Encode/decode calls per measurement")
+    parser.add_argument("--queued", type=int, default=2000, help="Requests queued per memory measurement")
+    parser.add_argument("--no-redis", action="store_true", help="Only measure encode/decode cost")
+    args = parser.parse_args()
+
+    print("encode/decode per payload")
+    for label, payload in (
+        ("text-only", redis_queue_manager._queue_payload(text_request(), str(uuid.uuid4()), "normal", "t", None)),
+        ("image-heavy", redis_queue_manager._queue_payload(image_request(), str(uuid.uuid4()), "normal", "t", None)),
+        ("result", result_payload()),
+    ):
+        measure_codec(label, payload, args.iterations)
+
+    if not args.no_redis:
+        print("\nRedis memory per queued request")
+        await measure_memory(args.queued)
+
+if __name__ == "__main__":
+    asyncio.run(main())
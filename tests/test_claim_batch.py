@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import fakeredis
+
+from app.services.redis_pool import (
+    CLAIM_BATCH_SCRIPT,
+    ENQUEUE_REQUEST_SCRIPT,
+    PRIORITIES,
+    RedisQueueManager,
+)
+from app.services.wire import decode_payload, encode_payload
+
+MODEL = "test-model"
+SLOT_TOKENS = 512
+MAX_SLOT_TOKENS = 1024
+
+def _payload(request_id: str, estimated_tokens: int, tenant: str = "anonymous") -> bytes:
+    now_ms = int(time.time() * 1000)
+    return encode_payload({
+        "id": request_id,
+        "data": {"model": MODEL},
+        "timestamp": now_ms,
+        "retry_count": 0,
+        "priority": "normal",
+        "tenant": tenant,
+        "deadline": now_ms + 60000,
+        "estimated_tokens": estimated_tokens
+    })
+
+async def _claim(requests, slot_tokens: int = SLOT_TOKENS, max_slot_tokens: int = MAX_SLOT_TOKENS):
+    """Enqueue (request_id, estimated_tokens, tenant) tuples in order and run one claim"""
+    manager = RedisQueueManager()
+    client = fakeredis.FakeAsyncRedis()
+    stream = manager.model_dispatch_stream(MODEL)
+    prefix = manager.model_queue_prefix(MODEL)
+    # fakeredis does not implement XGROUP inside scripts
+    await client.xgroup_create(stream, manager.dispatch_group, id="0", mkstream=True)
+
+    enqueue = client.register_script(ENQUEUE_REQUEST_SCRIPT)
+    for request_id, estimated_tokens, tenant in requests:
+        await enqueue(keys=[manager.queued_requests], args=[prefix, _payload(request_id, estimated_tokens, tenant)])
+
+    claim = client.register_script(CLAIM_BATCH_SCRIPT)
+    claimed, expired, exhausted, taken_over, cancelled, blocked = await claim(
+        keys=[manager.inflight_requests, stream, manager.queued_requests],
+        args=[
+            prefix, manager.dispatch_group, "consumer", int(time.time() * 1000), 30000, 3, "{}",
+            len(requests), -1, manager.cancel_prefix, slot_tokens, max_slot_tokens, *PRIORITIES
+        ]
+    )
+    pending = await client.hget(f"{prefix}:pending", "normal")
+    return [decode_payload(item)["id"] for item in claimed], blocked, int(pending or 0)
+
+def test_request_too_large_for_any_slot_is_claimed():
+    # Claimed so the dispatcher fails it as context_exceeded instead of it blocking the tenant
+    claimed, blocked, pending = asyncio.run(_claim([("huge", 2000, "anonymous"), ("small", 16, "anonymous")]))
+    assert claimed == ["huge", "small"]
+    assert blocked == 0
+    assert pending == 0
+
+def test_request_larger_than_free_slots_waits_without_blocking_other_tenants():
+    claimed, blocked, pending = asyncio.run(_claim([("large", 800, "a"), ("small", 16, "b")]))
+    assert claimed == ["small"]
+    assert blocked > 0
+    assert pending == 1
+
+def test_request_fitting_a_free_slot_is_claimed():
+    claimed, blocked, pending = asyncio.run(_claim([("fits", 500, "anonymous")]))
+    assert claimed == ["fits"]
+    assert blocked == 0
+    assert pending == 0
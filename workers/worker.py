@@ -1,13 +1,26 @@
 import os
 import sys
+import json
 import subprocess
+import threading
 import time
 import signal
+import urllib.error
+import urllib.request
 import redis
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379")
 MODEL_PATH = os.environ.get("MODEL_PATH")
+# Name clients pass as ChatRequest.model; the worker joins that model's pool
+MODEL_NAME = os.environ.get("MODEL_NAME") or os.path.splitext(os.path.basename(MODEL_PATH or ""))[0]
 WORKER_PORT = os.environ.get("WORKER_PORT")
+PARALLEL_SLOTS = os.environ.get("PARALLEL_SLOTS", "8")
+CONTEXT_SIZE = os.environ.get("CONTEXT_SIZE", "4096")
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "5"))
+HEARTBEAT_TTL = int(os.environ.get("HEARTBEAT_TTL", "15"))
+# Longest a beat in progress can take: /health and /slots time out after 2 s each
+HEARTBEAT_JOIN_TIMEOUT = 10
+READINESS_POLL_INTERVAL = 0.5
 
 API_ACCESSIBLE_HOSTNAME = os.environ.get("API_ACCESSIBLE_HOSTNAME")
 API_ACCESSIBLE_PORT = os.environ.get("API_ACCESSIBLE_PORT")
@@ -19,8 +32,16 @@ class LlamaCppWorker:
             sys.exit(1)
 
         self.worker_url = f"http://{API_ACCESSIBLE_HOSTNAME}:{API_ACCESSIBLE_PORT}"
+        self.heartbeat_key = f"worker_heartbeat:{self.worker_url}"
+        self.load_key = f"worker_load:{MODEL_NAME}"
+        self.slots_key = f"worker_slots:{MODEL_NAME}"
+        self.context_key = f"worker_context:{MODEL_NAME}"
+        self.health_url = f"http://127.0.0.1:{WORKER_PORT}/health"
+        self.slots_url = f"http://127.0.0.1:{WORKER_PORT}/slots"
         self.redis_client = redis.from_url(REDIS_URL, decode_responses=True)
         self.llama_process = None
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread = None
 
     def _wait_for_redis(self):
         print("Connecting to Redis...")
@@ -33,15 +54,84 @@ class LlamaCppWorker:
                 print("Waiting for Redis...")
                 time.sleep(2)
 
+    def _llama_health(self):
+        """llama-server's /health body when it is ready to serve, None while loading or unreachable"""
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=2) as response:
+                return json.loads(response.read() or b"{}")
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def _slots_processing(self):
+        """
+        Busy slots according to llama-server's /slots, None if the endpoint is disabled.
+        Older builds report a numeric state per slot instead of is_processing.
+        """
+        try:
+            with urllib.request.urlopen(self.slots_url, timeout=2) as response:
+                slots = json.loads(response.read())
+            return sum(1 for slot in slots if slot.get("is_processing", slot.get("state", 0) != 0))
+        except (urllib.error.URLError, OSError, ValueError, TypeError, AttributeError):
+            return None
+
+    def _wait_for_llama_server(self):
+        """llama-server answers /health with 503 until the model is loaded"""
+        print("Waiting for llama-server to load the model...")
+        start = time.time()
+        while self._llama_health() is None:
+            if self.llama_process.poll() is not None:
+                print("llama-server exited before becoming ready.", file=sys.stderr)
+                sys.exit(1)
+            time.sleep(READINESS_POLL_INTERVAL)
+        print(f"llama-server ready after {time.time() - start:.1f}s")
+
     def _register_with_redis(self):
-        print(f"Registering host-accessible worker URL: {self.worker_url}")
-        self.redis_client.lpush("idle_workers", self.worker_url)
-        print("Worker registered successfully.")
+        """Idempotent, so every heartbeat can restore a registration the API evicted"""
+        self.redis_client.hset(self.slots_key, self.worker_url, PARALLEL_SLOTS)
+        self.redis_client.hset(self.context_key, self.worker_url, CONTEXT_SIZE)
+        self.redis_client.zadd(self.load_key, {self.worker_url: 0}, nx=True)
+        self.redis_client.sadd("worker_models", MODEL_NAME)
+
+    def _send_heartbeat(self):
+        """The API corrects drift in its slot accounting against slots_processing"""
+        self.redis_client.set(self.heartbeat_key, json.dumps({
+            "model": MODEL_NAME,
+            "slots": int(PARALLEL_SLOTS),
+            "context": int(CONTEXT_SIZE),
+            "slots_processing": self._slots_processing(),
+            "timestamp": time.time()
+        }), ex=HEARTBEAT_TTL)
+
+    def _heartbeat_loop(self):
+        """
+        Heartbeat only while llama-server answers /health. If it hangs or the container is
+        killed, the key expires and the API stops routing to this worker.
+        """
+        while not self._stop_heartbeat.is_set():
+            if self._llama_health() is not None:
+                try:
+                    self._send_heartbeat()
+                    self._register_with_redis()
+                except redis.exceptions.RedisError as e:
+                    print(f"Heartbeat failed: {e}", file=sys.stderr)
+            else:
+                print("llama-server health check failed, skipping heartbeat", file=sys.stderr)
+            self._stop_heartbeat.wait(HEARTBEAT_INTERVAL)
 
     def _deregister_from_redis(self):
         print(f"Deregistering worker: {self.worker_url}")
-        self.redis_client.lrem("idle_workers", 0, self.worker_url)
-        self.redis_client.lrem("busy_workers", 0, self.worker_url)
+        self._stop_heartbeat.set()
+        # A beat in progress would otherwise re-register the worker after the keys are removed
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join(HEARTBEAT_JOIN_TIMEOUT)
+            if self._heartbeat_thread.is_alive():
+                print("Heartbeat thread did not stop in time", file=sys.stderr)
+        self.redis_client.delete(self.heartbeat_key)
+        self.redis_client.zrem(self.load_key, self.worker_url)
+        self.redis_client.hdel(self.slots_key, self.worker_url)
+        self.redis_client.hdel(self.context_key, self.worker_url)
+        if not self.redis_client.hlen(self.slots_key):
+            self.redis_client.srem("worker_models", MODEL_NAME)
         print("Worker deregistered.")
 
     def start_llama_server(self):
@@ -53,11 +143,11 @@ class LlamaCppWorker:
             "-m", MODEL_PATH,
             "--host", "0.0.0.0",
             "--port", WORKER_PORT,
-            "-c", "4096",
+            "-c", CONTEXT_SIZE,
             "--threads", "4",
             "--mlock",
             "--cont-batching",
-            "--parallel", "8",
+            "--parallel", PARALLEL_SLOTS,
             "--flash-attn",
             "-ngl", gpu_layers,
             "--tensor-split", gpu_split,
@@ -96,8 +186,13 @@ class LlamaCppWorker:
         self._wait_for_redis()
         self.start_llama_server()
 
-        time.sleep(10)
+        self._wait_for_llama_server()
+        print(f"Registering host-accessible worker URL: {self.worker_url} for model {MODEL_NAME}")
+        self._send_heartbeat()
         self._register_with_redis()
+        print("Worker registered successfully.")
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat_thread.start()
 
         try:
             self.llama_process.wait()